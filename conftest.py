@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def test_settings():
+    """Настройки тестов из core.testing и для pytest."""
+    from core.testing import override_test_settings
+
+    restore = override_test_settings()
+    yield
+    restore()
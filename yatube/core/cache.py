@@ -0,0 +1,538 @@
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.signals import request_started
+
+
+class SQLiteCache(BaseCache):
+    """Общий для всех процессов кэш в файле SQLite.
+
+    В отличие от LocMemCache его видят все воркеры на машине, поэтому
+    сброс кэша в одном процессе сразу действует в остальных. Каждая
+    операция — отдельная транзакция SQLite; при превышении MAX_SIZE
+    байт вытесняются давно не читанные записи (LRU).
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/path/to/cache.sqlite3',
+            'OPTIONS': {'MAX_SIZE': 256 * 1024 * 1024},
+        }
+    }
+    """
+
+    # Время последнего чтения обновляется не чаще, чем раз в столько
+    # секунд: иначе каждое чтение превращалось бы в запись.
+    touch_interval = 1
+    busy_timeout = 5
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_size = int(options.get('MAX_SIZE', 256 * 1024 * 1024))
+        # Проверка размера после каждых cull_every записей.
+        self.cull_every = int(options.get('CULL_EVERY', 100))
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.location,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            # Иначе INSERT OR REPLACE удаляет старую строку без триггера
+            # и общий размер расходится с таблицей.
+            connection.execute('PRAGMA recursive_triggers=ON')
+            connection.executescript('''
+                BEGIN IMMEDIATE;
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL,
+                    accessed REAL NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+                CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+                CREATE TABLE IF NOT EXISTS cache_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    total INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO cache_size
+                    SELECT 1, COALESCE(SUM(size), 0) FROM cache;
+                CREATE TRIGGER IF NOT EXISTS cache_size_insert
+                AFTER INSERT ON cache BEGIN
+                    UPDATE cache_size SET total = total + NEW.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS cache_size_delete
+                AFTER DELETE ON cache BEGIN
+                    UPDATE cache_size SET total = total - OLD.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS cache_size_update
+                AFTER UPDATE OF size ON cache BEGIN
+                    UPDATE cache_size SET total = total - OLD.size + NEW.size;
+                END;
+                COMMIT;
+            ''')
+            self._local.connection = connection
+        return connection
+
+    def transaction(self):
+        """BEGIN IMMEDIATE: запись блокируется сразу, а не при первом
+        изменении, так что чтение-изменение-запись атомарно между
+        процессами."""
+        return _Transaction(self.connection)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self.transaction() as connection:
+            self._delete_expired(connection, key)
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)',
+                self._row(key, value, timeout),
+            )
+            added = cursor.rowcount == 1
+        if added:
+            self._wrote()
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        return {
+            made[key]: value
+            for key, value in self._get_many(list(made)).items()
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append(self._row(key, value, timeout))
+        if rows:
+            with self.transaction() as connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+                    rows,
+                )
+            self._wrote(len(rows))
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE cache SET expires = ? '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), key, time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (blob, len(key) + len(blob), key),
+            )
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version=version) for key in keys]
+        for key in made:
+            self.validate_key(key)
+        if made:
+            with self.transaction() as connection:
+                connection.executemany(
+                    'DELETE FROM cache WHERE key = ?',
+                    [(key,) for key in made],
+                )
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key in self._get_many([key])
+
+    def clear(self):
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт весь срок потока: открытие файла и проверка
+        # схемы на каждый запрос стоили бы дороже самого кэша.
+        pass
+
+    def cull(self):
+        """Удаляет просроченные записи и самые давно читанные сверх
+        MAX_SIZE байт.
+
+        Общий размер ведут триггеры в cache_size, так что проверка
+        обходится без блокировки записи и без обхода таблицы; окно по
+        всем записям считается, только когда бюджет превышен.
+        """
+        now = time.time()
+        expired = self.connection.execute(
+            'SELECT 1 FROM cache WHERE expires <= ? LIMIT 1', (now,)
+        ).fetchone()
+        if expired is None and self._size() <= self.max_size:
+            return
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+            if self._size() <= self.max_size:
+                return
+            connection.execute(
+                '''
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (
+                            ORDER BY accessed DESC, key
+                        ) AS running
+                        FROM cache
+                    ) WHERE running > ?
+                )
+                ''',
+                (self.max_size,),
+            )
+
+    def _size(self):
+        return self.connection.execute(
+            'SELECT total FROM cache_size'
+        ).fetchone()[0]
+
+    def _row(self, key, value, timeout):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return (
+            key, blob, self.get_backend_timeout(timeout), time.time(),
+            len(key) + len(blob),
+        )
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ', '.join('?' * len(keys))
+        rows = self.connection.execute(
+            f'SELECT key, value, expires, accessed FROM cache '
+            f'WHERE key IN ({placeholders})',
+            keys,
+        ).fetchall()
+        found = {}
+        expired = []
+        stale = []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append((key, now))
+                continue
+            found[key] = pickle.loads(value)
+            if accessed < now - self.touch_interval:
+                stale.append((now, key))
+        if expired or stale:
+            with self.transaction() as connection:
+                connection.executemany(
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    expired,
+                )
+                connection.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?', stale
+                )
+        return found
+
+    def _delete_expired(self, connection, key):
+        connection.execute(
+            'DELETE FROM cache WHERE key = ? AND expires <= ?',
+            (key, time.time()),
+        )
+
+    def _wrote(self, count=1):
+        self._writes += count
+        if self._writes >= self.cull_every:
+            self._writes = 0
+            self.cull()
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class _LocalStore:
+    """LRU-словарь процесса с TTL записей и бюджетом памяти."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.epoch = None
+        self.checked = float('-inf')
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, pickled, expires, size = entry
+            if expires <= time.time():
+                self._pop(key)
+                return _MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(value) if pickled else value
+
+    def put(self, key, value, timeout):
+        if _is_immutable(value):
+            size = len(key) + len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            stored, pickled = value, False
+        else:
+            stored = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            size, pickled = len(key) + len(stored), True
+        if size > self.max_size:
+            self.delete(key)
+            return
+        with self.lock:
+            self._pop(key)
+            self.entries[key] = (stored, pickled, time.time() + timeout, size)
+            self.size += size
+            while self.size > self.max_size:
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[3]
+
+
+_MISSING = object()
+_IMMUTABLE = (str, bytes, int, float, bool, type(None))
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def _is_immutable(value):
+    if isinstance(value, tuple):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE)
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш: LRU в памяти процесса перед общим кэшем.
+
+    В памяти держатся только ключи с префиксами LOCAL_PREFIXES — те,
+    что не меняются под тем же именем (страницы и карточки по
+    поколениям) или меняются только вместе с эпохой. Запись ключа с
+    префиксом из EPOCH_PREFIXES (поколения, версии) сдвигает общую
+    эпоху, add нового ключа — нет; каждый процесс сверяет эпоху
+    в начале запроса и при расхождении очищает свой уровень, так что
+    сигналы posts доходят до всех воркеров к следующему запросу.
+    Остальные ключи (сессии, блокировки, счётчики) идут прямо в общий
+    кэш SHARED.
+    """
+
+    epoch_key = 'tiered:epoch'
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.local_prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self.epoch_prefixes = tuple(options.get('EPOCH_PREFIXES', ()))
+        self.check_interval = options.get('CHECK_INTERVAL', 1)
+        with _local_stores_lock:
+            if location not in _local_stores:
+                _local_stores[location] = _LocalStore(
+                    int(options.get('MAX_SIZE', 32 * 1024 * 1024))
+                )
+                request_started.connect(
+                    self._expire_check, weak=False,
+                    dispatch_uid=f'tiered-cache-{location}',
+                )
+            self.store = _local_stores[location]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Эпоха не сдвигается: новый ключ не делает устаревшими ничьи
+        # копии, ведь ни у кого его ещё нет.
+        added = self.shared.add(key, value, timeout, version)
+        if added and self._is_local(key):
+            local_timeout = self.local_timeout
+            if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+                local_timeout = min(timeout, local_timeout)
+            self.store.put(self._key(key, version), value, local_timeout)
+        return added
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        self._check_epoch()
+        for key in keys:
+            value = _MISSING
+            if self._is_local(key):
+                value = self.store.get(self._key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            for key, value in fetched.items():
+                if self._is_local(key):
+                    self.store.put(
+                        self._key(key, version), value, self.local_timeout
+                    )
+            found.update(fetched)
+        return found
+
+    def refresh_many(self, keys, version=None):
+        """Значения из общего кэша мимо памяти процесса; её копии
+        заменяются прочитанными.
+
+        Нужно тому, кто нашёл в памяти просроченную запись: в общем кэше
+        её мог уже обновить другой процесс, а запись без префикса эпохи
+        не сбрасывает чужие копии.
+        """
+        keys = list(keys)
+        fetched = self.shared.get_many(keys, version=version)
+        for key in keys:
+            if not self._is_local(key):
+                continue
+            if key in fetched:
+                self.store.put(
+                    self._key(key, version), fetched[key], self.local_timeout
+                )
+            else:
+                self.store.delete(self._key(key, version))
+        return fetched
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        local_timeout = self.local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            local_timeout = min(timeout, local_timeout)
+        for key, value in data.items():
+            if self._is_local(key):
+                self.store.put(self._key(key, version), value, local_timeout)
+        if any(key.startswith(self.epoch_prefixes) for key in data):
+            self._bump_epoch()
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        if self._is_local(key):
+            self.store.delete(self._key(key, version))
+            self._bump_epoch()
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version=version)
+        local = [key for key in keys if self._is_local(key)]
+        for key in local:
+            self.store.delete(self._key(key, version))
+        if local:
+            self._bump_epoch()
+
+    def has_key(self, key, version=None):
+        return key in self.get_many([key], version=version)
+
+    def clear(self):
+        self.shared.clear()
+        self.store.clear()
+        self._bump_epoch()
+
+    def _key(self, key, version):
+        return self.make_key(key, version=version)
+
+    def _is_local(self, key):
+        return key.startswith(self.local_prefixes)
+
+    def _bump_epoch(self):
+        self.shared.add(self.epoch_key, 0, None)
+        epoch = self.shared.incr(self.epoch_key)
+        # Свой уровень уже содержит новые значения, и сбрасывать его
+        # нужно, только если эпоху успел сдвинуть кто-то ещё.
+        if self.store.epoch != epoch - 1:
+            self.store.clear()
+        self.store.epoch = epoch
+        self.store.checked = time.monotonic()
+
+    def _check_epoch(self):
+        now = time.monotonic()
+        if now - self.store.checked < self.check_interval:
+            return
+        epoch = self.shared.get(self.epoch_key)
+        if epoch != self.store.epoch:
+            self.store.clear()
+            self.store.epoch = epoch
+        self.store.checked = now
+
+    def _expire_check(self, **kwargs):
+        self.store.checked = float('-inf')
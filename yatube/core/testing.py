@@ -0,0 +1,36 @@
+"""Окружение тестов: общий кэш во временном файле, а не в cache.sqlite3
+рабочей копии, который могут читать запущенные рядом воркеры, и
+миниатюры без фоновых потоков, которые пережили бы свой тест и писали
+в его временный MEDIA_ROOT."""
+import os
+import shutil
+import tempfile
+from copy import deepcopy
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def override_test_settings():
+    """Включает настройки тестов; возвращает функцию отката."""
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = deepcopy(settings.CACHES)
+    caches['shared']['LOCATION'] = os.path.join(directory, 'cache.sqlite3')
+    override = override_settings(CACHES=caches, POST_THUMBNAIL_WORKERS=0)
+    override.enable()
+
+    def restore():
+        override.disable()
+        shutil.rmtree(directory, ignore_errors=True)
+    return restore
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.restore_settings = override_test_settings()
+
+    def teardown_test_environment(self, **kwargs):
+        self.restore_settings()
+        super().teardown_test_environment(**kwargs)
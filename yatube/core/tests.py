@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache import caches
+from django.core.signals import request_started
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import SQLiteCache, TieredCache, _local_stores
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    """Общий кэш в файле SQLite."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_shared_between_instances(self):
+        """Запись одного процесса видна другому."""
+        other = self.make_cache()
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(other.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+        other.delete('a')
+        self.assertFalse(self.cache.has_key('a'))
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.cache.add('lock', 1))
+        self.assertFalse(self.make_cache().add('lock', 1))
+        self.assertEqual(self.cache.incr('lock', 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expired_entries_are_ignored(self):
+        self.cache.set('key', 'value', timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+
+    def test_lru_eviction_under_budget(self):
+        cache = self.make_cache(MAX_SIZE=3000, CULL_EVERY=1)
+        cache.touch_interval = 0
+        for index in range(3):
+            cache.set(f'key{index}', 'x' * 900)
+            time.sleep(0.01)
+        cache.get('key0')
+        cache.set('key3', 'x' * 900)
+        self.assertIsNotNone(cache.get('key0'))
+        self.assertIsNone(cache.get('key1'))
+        self.assertIsNotNone(cache.get('key3'))
+
+    def test_size_total_follows_writes(self):
+        """Размер из cache_size совпадает с суммой по таблице."""
+        connection = self.cache.connection
+
+        def assertTotal():
+            self.assertEqual(
+                self.cache._size(),
+                connection.execute(
+                    'SELECT COALESCE(SUM(size), 0) FROM cache'
+                ).fetchone()[0],
+            )
+
+        self.cache.set_many({'a': 'x' * 100, 'b': 1})
+        assertTotal()
+        self.cache.set('a', 'x' * 10)
+        assertTotal()
+        self.cache.add('c', 2)
+        self.cache.incr('b', 10 ** 20)
+        assertTotal()
+        self.cache.delete('c')
+        assertTotal()
+        self.cache.clear()
+        self.assertEqual(self.cache._size(), 0)
+
+    def test_cull_under_budget_skips_eviction(self):
+        cache = self.make_cache(MAX_SIZE=3000, CULL_EVERY=1)
+        statements = []
+        cache.connection.set_trace_callback(statements.append)
+        for index in range(3):
+            cache.set(f'key{index}', 'x' * 100)
+        self.assertFalse(any('OVER' in sql for sql in statements))
+        self.assertFalse(any(
+            sql.startswith('DELETE') for sql in statements
+        ))
+        cache.set('big', 'x' * 3000)
+        self.assertTrue(any('OVER' in sql for sql in statements))
+
+
+class TieredCacheTest(SimpleTestCase):
+    """Память процесса перед общим кэшем и сброс по эпохе."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND': 'core.cache.SQLiteCache',
+                'LOCATION': os.path.join(self.directory, 'cache.sqlite3'),
+            },
+        })
+        self.settings.enable()
+        self.first = self.make_worker('first')
+        self.second = self.make_worker('second')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_worker(self, name, **options):
+        options = {
+            'SHARED': 'shared',
+            'LOCAL_PREFIXES': ('page:', 'generation:'),
+            'EPOCH_PREFIXES': ('generation:',),
+            **options,
+        }
+        _local_stores.pop(f'{self.id()}-{name}', None)
+        return TieredCache(f'{self.id()}-{name}', {'OPTIONS': options})
+
+    def test_local_hit_skips_shared_cache(self):
+        self.first.set('page:1', b'html')
+        caches['shared'].delete('page:1')
+        self.assertEqual(self.first.get('page:1'), b'html')
+        self.assertIsNone(self.second.get('page:1'))
+
+    def test_other_keys_are_not_kept_locally(self):
+        self.first.set('session:1', 'data')
+        caches['shared'].delete('session:1')
+        self.assertIsNone(self.first.get('session:1'))
+
+    def test_epoch_invalidates_other_workers(self):
+        self.first.set('generation:index', 1)
+        self.assertEqual(self.second.get('generation:index'), 1)
+        self.first.set('generation:index', 2)
+        self.assertEqual(self.first.get('generation:index'), 2)
+        request_started.send(sender=self.__class__)
+        self.assertEqual(self.second.get('generation:index'), 2)
+
+    def test_add_does_not_move_epoch(self):
+        """Заведённый через add ключ не сбрасывает память воркеров."""
+        self.first.set('generation:index', 1)
+        self.assertEqual(self.second.get('generation:index'), 1)
+        epoch = caches['shared'].get(TieredCache.epoch_key)
+        self.assertTrue(self.first.add('generation:group', 1))
+        self.assertFalse(self.second.add('generation:group', 2))
+        self.assertEqual(caches['shared'].get(TieredCache.epoch_key), epoch)
+        self.assertEqual(self.first.get('generation:group'), 1)
+
+    def test_refresh_replaces_local_copy(self):
+        """refresh_many читает мимо памяти и обновляет её копию."""
+        self.first.set('page:1', 'старое')
+        self.assertEqual(self.second.get('page:1'), 'старое')
+        self.first.set('page:1', 'новое')
+        self.assertEqual(self.second.get('page:1'), 'старое')
+        self.assertEqual(
+            self.second.refresh_many(['page:1']), {'page:1': 'новое'}
+        )
+        self.assertEqual(self.second.get('page:1'), 'новое')
+        self.first.delete('page:1')
+        self.assertEqual(self.second.refresh_many(['page:1']), {})
+        self.assertIsNone(self.second.get('page:1'))
+
+    def test_memory_budget(self):
+        worker = self.make_worker('small', MAX_SIZE=200)
+        worker.set('page:1', 'x' * 100)
+        worker.set('page:2', 'x' * 100)
+        self.assertLessEqual(worker.store.size, 200)
+        self.assertNotIn(worker.make_key('page:1'), worker.store.entries)
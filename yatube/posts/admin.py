@@ -1,6 +1,10 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse
 
 from .models import Group, Post, Comment, Follow
+from .export import post_records, stream_jsonl_gz
+from .search import is_available, match_expression, matching_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,6 +14,29 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    actions = ('export_posts',)
+
+    def export_posts(self, request, queryset):
+        # Ответ собирается по мере чтения: выбор из тысяч постов
+        # не держится в памяти целиком.
+        response = StreamingHttpResponse(
+            stream_jsonl_gz(post_records(queryset)),
+            content_type='application/gzip',
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="posts.jsonl.gz"'
+        )
+        return response
+    export_posts.short_description = 'Выгрузить выбранные посты (JSONL)'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через индекс FTS5, а не LIKE '%...%'.
+        if not is_available() or not match_expression(search_term):
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        sql, params = matching_ids(search_term)
+        return queryset.filter(id__in=RawSQL(sql, params)), False
 
 
 class GroupAdmin(admin.ModelAdmin):
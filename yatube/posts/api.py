@@ -0,0 +1,325 @@
+"""JSON-версия лент и страниц постов только для чтения.
+
+Вьюхи повторяют posts.views, но отдают данные без шаблонов
+и миниатюр: автор и группа приходят в том же запросе, что и посты,
+ленты листаются курсором, а ETag и кэш ответа ведут те же поколения
+областей, что и у HTML-страниц.
+"""
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+
+from .caching import (
+    CARD_TIMEOUT, cache_page_by_generation, condition_by_generation,
+    generation_key, get_generations, get_group, get_post_versions,
+    post_scope, version_key,
+)
+from .models import Post, Timeline, UserStats
+from .paginators import CursorPaginator
+from .views import (
+    POSTS_PER_PAGE, follow_scopes, get_author, get_comments_page,
+    group_scopes, index_scopes, post_scopes, profile_scopes,
+)
+
+# Сколько постов можно запросить одним вызовом posts/batch/.
+BATCH_MAX = 100
+
+
+def serialize_author(user):
+    return {'username': user.username, 'full_name': user.get_full_name()}
+
+
+def serialize_group(group):
+    if group is None:
+        return None
+    return {'slug': group.slug, 'title': group.title}
+
+
+def serialize_image(post):
+    if not post.image:
+        return None
+    return {
+        'url': post.image.url,
+        'width': post.image_width,
+        'height': post.image_height,
+        'color': post.image_color or None,
+    }
+
+
+# Поля поста, которые можно запросить через ?fields=.
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'author': lambda post: serialize_author(post.author),
+    'group': lambda post: serialize_group(post.group),
+    'image': serialize_image,
+    'comments_count': lambda post: post.comments_count,
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error(message, status):
+    return JsonResponse({'detail': message}, status=status)
+
+
+def api_view(view):
+    """GET/HEAD и ошибки в виде JSON, а не HTML-страниц."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404 as exception:
+            return error(str(exception) or 'Не найдено.', 404)
+        except BadRequest as exception:
+            return error(str(exception), 400)
+    return wrapper
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error('Нужно войти.', 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def requested_fields(request):
+    """Поля из ?fields=id,text,...; без параметра — все."""
+    value = request.GET.get('fields')
+    if not value:
+        return tuple(POST_FIELDS)
+    fields = tuple(dict.fromkeys(
+        field.strip() for field in value.split(',') if field.strip()
+    ))
+    unknown = [field for field in fields if field not in POST_FIELDS]
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def serialize_post(post, fields):
+    return {field: POST_FIELDS[field](post) for field in fields}
+
+
+def page_url(request, **cursor):
+    params = request.GET.copy()
+    for name in ('after', 'before', 'page'):
+        params.pop(name, None)
+    params.update(cursor)
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def check_cursor(paginator, value):
+    # HTML-страницы с испорченным курсором показывают первую страницу,
+    # а клиенту API лучше узнать, что его курсор не годится.
+    if value and paginator.decode_cursor(value) is None:
+        raise BadRequest('Неверный курсор страницы.')
+
+
+def feed(request, queryset, keys=('pub_date', 'id'), transform=None):
+    """Страница ленты: посты и ссылки на соседние страницы."""
+    fields = requested_fields(request)
+    paginator = CursorPaginator(
+        queryset, POSTS_PER_PAGE, keys=keys, transform=transform
+    )
+    after, before = request.GET.get('after'), request.GET.get('before')
+    check_cursor(paginator, after)
+    check_cursor(paginator, before)
+    page = paginator.get_page(after=after, before=before)
+    return {
+        'results': [serialize_post(post, fields) for post in page],
+        'next': paginator.next_cursor and page_url(
+            request, after=paginator.next_cursor
+        ),
+        'previous': paginator.previous_cursor and page_url(
+            request, before=paginator.previous_cursor
+        ),
+    }
+
+
+@api_view
+@condition_by_generation(index_scopes)
+@cache_page_by_generation(index_scopes)
+def index(request):
+    return JsonResponse(
+        feed(request, Post.objects.select_related('author', 'group'))
+    )
+
+
+@api_view
+@condition_by_generation(group_scopes)
+@cache_page_by_generation(group_scopes)
+def group_posts(request, slug):
+    group = get_group(slug)
+    data = {'group': dict(
+        serialize_group(group), description=group.description
+    )}
+    data.update(feed(request, group.posts.select_related('author', 'group')))
+    return JsonResponse(data)
+
+
+@api_view
+@condition_by_generation(profile_scopes)
+@cache_page_by_generation(profile_scopes)
+def profile(request, username):
+    author = get_author(request, username)
+    stats = UserStats.for_user(author)
+    following = (
+        request.user.is_authenticated
+        and author.following.filter(user=request.user).exists()
+    )
+    data = {'author': dict(
+        serialize_author(author),
+        posts_count=stats.posts_count,
+        followers_count=stats.followers_count,
+        following_count=stats.following_count,
+        following=following,
+    )}
+    data.update(feed(request, author.posts.select_related('author', 'group')))
+    return JsonResponse(data)
+
+
+@api_view
+@condition_by_generation(post_scopes)
+@cache_page_by_generation(post_scopes)
+def post_detail(request, post_id):
+    fields = requested_fields(request)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    after = request.GET.get('after')
+    comments = get_comments_page(post.pk, after)
+    check_cursor(comments.paginator, after)
+    next_cursor = comments.paginator.next_cursor
+    data = serialize_post(post, fields)
+    data['comments'] = {
+        'results': [
+            {
+                'id': comment.pk,
+                'author': serialize_author(comment.author),
+                'text': comment.text,
+                'created': comment.created.isoformat(),
+            }
+            for comment in comments
+        ],
+        'next': next_cursor and page_url(request, after=next_cursor),
+    }
+    return JsonResponse(data)
+
+
+@api_view
+@api_login_required
+@condition_by_generation(follow_scopes)
+@cache_page_by_generation(follow_scopes)
+def follow_index(request):
+    entries = Timeline.objects.filter(
+        user=request.user
+    ).select_related('post__author', 'post__group')
+    return JsonResponse(feed(
+        request, entries, keys=('pub_date', 'post'),
+        transform=lambda entry: entry.post,
+    ))
+
+
+def parse_ids(value):
+    """id из ?ids=3,1,2 в порядке запроса, без повторов."""
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise BadRequest('ids — это числа через запятую.')
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise BadRequest('Не указаны ids.')
+    if len(ids) > BATCH_MAX:
+        raise BadRequest(f'Не больше {BATCH_MAX} постов за раз.')
+    return ids
+
+
+def post_key(post_id, version, generation):
+    return f'api:post:{post_id}:{version}:{generation}'
+
+
+def known_post_keys(post_ids):
+    """Ключи кэша для постов, у которых уже есть версия карточки
+    и поколение страницы. Недостающие здесь не заводятся: id приходят
+    из запроса, и для несуществующих постов ключей быть не должно."""
+    versions = {post_id: version_key(post_id) for post_id in post_ids}
+    generations = {
+        post_id: generation_key(post_scope(post_id)) for post_id in post_ids
+    }
+    found = cache.get_many(
+        list(versions.values()) + list(generations.values())
+    )
+    return {
+        post_id: post_key(
+            post_id, found[versions[post_id]], found[generations[post_id]]
+        )
+        for post_id in post_ids
+        if versions[post_id] in found and generations[post_id] in found
+    }
+
+
+def cached_posts(post_ids):
+    """Посты по id в виде словарей со всеми полями.
+
+    Ключ включает версию карточки (меняется с автором и группой)
+    и поколение страницы поста (правка, удаление, комментарии),
+    так что тёплый кэш отдаёт посты без запросов к базе. Остальные
+    читаются одним запросом, и ключи заводятся только для найденных.
+    Удалённых постов в ответе нет.
+    """
+    keys = known_post_keys(post_ids)
+    found = cache.get_many(keys.values())
+    posts = {
+        post_id: found[key] for post_id, key in keys.items() if key in found
+    }
+    missing = [post_id for post_id in post_ids if post_id not in posts]
+    if not missing:
+        return posts
+    loaded = {
+        post.pk: serialize_post(post, POST_FIELDS)
+        for post in Post.objects.select_related(
+            'author', 'group'
+        ).filter(pk__in=missing)
+    }
+    if loaded:
+        versions = get_post_versions(loaded)
+        generations = get_generations(
+            [post_scope(post_id) for post_id in loaded]
+        )
+        cache.set_many(
+            {
+                post_key(
+                    post_id, versions[post_id],
+                    generations[post_scope(post_id)],
+                ): data
+                for post_id, data in loaded.items()
+            },
+            CARD_TIMEOUT,
+        )
+    posts.update(loaded)
+    return posts
+
+
+@api_view
+def posts_batch(request):
+    """Много постов за один запрос — для уведомлений и выдачи поиска."""
+    fields = requested_fields(request)
+    post_ids = parse_ids(request.GET.get('ids', ''))
+    posts = cached_posts(post_ids)
+    return JsonResponse({
+        'results': [
+            {field: posts[post_id][field] for field in fields}
+            for post_id in post_ids if post_id in posts
+        ],
+        'missing': [post_id for post_id in post_ids if post_id not in posts],
+    })
@@ -0,0 +1,469 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.views.decorators.http import condition
+
+from .models import Follow, Group
+
+CARD_TEMPLATE = 'includes/post.html'
+CARD_TIMEOUT = 60 * 60 * 24
+PAGE_TIMEOUT = 60 * 60
+VERSION_TIMEOUT = None
+# Сколько просроченная запись ещё может отдаваться, пока её пересобирают.
+STALE_TIMEOUT = 60
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2
+WAIT_STEP = 0.05
+METRICS = ('hit', 'stale', 'wait', 'rebuild')
+METRICS_FLUSH_INTERVAL = 10
+
+pending_metrics = Counter()
+metrics_lock = threading.Lock()
+metrics_flushed_at = time.monotonic()
+
+
+def new_version():
+    # Версия из времени, а не счётчик с единицы: если ключ версии
+    # вытеснят из кэша, новая версия не совпадёт со старыми карточками.
+    return time.time_ns()
+
+
+def version_key(post_id):
+    return f'version:post:{post_id}'
+
+
+def card_key(post_id, version):
+    return f'card:{post_id}:{version}'
+
+
+def init_versions(keys):
+    """Заводит недостающие ключи версий и поколений.
+
+    Через add, а не set: так не сдвигается эпоха TieredCache (это не
+    сброс), а ключ, который успел завести другой процесс, остаётся.
+    """
+    values = {}
+    taken = []
+    for key in keys:
+        value = new_version()
+        if cache.add(key, value, VERSION_TIMEOUT):
+            values[key] = value
+        else:
+            taken.append(key)
+    if taken:
+        values.update(cache.get_many(taken))
+    # Ключ вытеснили между add и чтением: страница просто не совпадёт
+    # ни с одной закэшированной.
+    values.update((key, new_version()) for key in keys if key not in values)
+    return values
+
+
+def get_post_versions(post_ids):
+    """Версии карточек постов; недостающие заводятся заново."""
+    keys = {version_key(post_id): post_id for post_id in post_ids}
+    found = cache.get_many(keys)
+    found.update(init_versions([key for key in keys if key not in found]))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def bump_post_versions(post_ids):
+    """Делает устаревшими закэшированные карточки постов."""
+    version = new_version()
+    cache.set_many(
+        {version_key(post_id): version for post_id in post_ids},
+        VERSION_TIMEOUT,
+    )
+
+
+def metric_key(name):
+    return f'metrics:{name}'
+
+
+def record(name, delta=1):
+    """Увеличивает счётчик события кэша (hit, stale, wait, rebuild).
+
+    Счёт идёт в памяти процесса и сбрасывается в общий кэш не чаще
+    раза в METRICS_FLUSH_INTERVAL: запись в кэш на каждый просмотр
+    страницы стоила бы транзакции.
+    """
+    global metrics_flushed_at
+    if not delta:
+        return
+    with metrics_lock:
+        pending_metrics[name] += delta
+        now = time.monotonic()
+        if now - metrics_flushed_at < METRICS_FLUSH_INTERVAL:
+            return
+        metrics_flushed_at = now
+    flush_metrics()
+
+
+def flush_metrics():
+    """Переносит накопленные процессом счётчики в общий кэш."""
+    with metrics_lock:
+        counts = dict(pending_metrics)
+        pending_metrics.clear()
+    for name, delta in counts.items():
+        if not delta:
+            continue
+        try:
+            cache.incr(metric_key(name), delta)
+        except ValueError:
+            cache.set(metric_key(name), delta, None)
+
+
+def reset_metrics():
+    global metrics_flushed_at
+    with metrics_lock:
+        pending_metrics.clear()
+        metrics_flushed_at = time.monotonic()
+    cache.delete_many([metric_key(name) for name in METRICS])
+
+
+def get_metrics():
+    flush_metrics()
+    found = cache.get_many([metric_key(name) for name in METRICS])
+    return {name: found.get(metric_key(name), 0) for name in METRICS}
+
+
+def lock_key(key):
+    # Свой префикс: блокировка не должна попасть в память процесса
+    # по префиксу ключа записи, а её снятие — сдвигать эпоху.
+    return f'lock:{key}'
+
+
+def acquire(key, timeout=LOCK_TIMEOUT):
+    """Берёт право пересобрать запись; успешен только один процесс."""
+    return cache.add(lock_key(key), 1, timeout)
+
+
+def release(key):
+    cache.delete(lock_key(key))
+
+
+def wrap(value, timeout):
+    return value, time.time() + timeout
+
+
+def store(key, value, timeout):
+    cache.set(key, wrap(value, timeout), timeout + STALE_TIMEOUT)
+
+
+def reread_many(keys):
+    # Просроченная копия могла прийти из памяти процесса, а другой
+    # воркер уже пересобрал запись: перечитываем её из общего кэша,
+    # прежде чем браться за пересборку самим.
+    return getattr(cache, 'refresh_many', cache.get_many)(keys)
+
+
+def get_or_build(key, build, timeout):
+    """Значение из кэша с защитой от одновременной пересборки.
+
+    Свежая запись отдаётся сразу. Просроченную пересобирает тот, кто
+    первым взял блокировку, остальные пока получают старую копию.
+    Если записи нет совсем, остальные недолго ждут результата первого.
+    build() возвращает значение для кэша или None, если кэшировать
+    результат нельзя.
+    """
+    entry = cache.get(key)
+    if entry is not None and time.time() >= entry[1]:
+        entry = reread_many([key]).get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            record('hit')
+            return value
+        if not acquire(key):
+            record('stale')
+            return value
+    elif not acquire(key):
+        deadline = time.time() + WAIT_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(WAIT_STEP)
+            entry = cache.get(key)
+            if entry is not None:
+                record('wait')
+                return entry[0]
+        return build()
+    try:
+        record('rebuild')
+        value = build()
+        if value is not None:
+            store(key, value, timeout)
+        return value
+    finally:
+        release(key)
+
+
+def render_post_cards(posts, prepare=None):
+    """Пары (пост, html карточки) с перерисовкой только изменившихся.
+
+    Просроченная карточка отдаётся как есть, если её уже пересобирает
+    другой запрос: содержимое по ключу версии не меняется.
+    prepare(posts) получает посты, которые будут перерисованы, и может
+    загрузить для них данные одним запросом.
+    """
+    posts = list(posts)
+    versions = get_post_versions([post.pk for post in posts])
+    keys = {post.pk: card_key(post.pk, versions[post.pk]) for post in posts}
+    entries = cache.get_many(keys.values())
+    now = time.time()
+    expired = [key for key, entry in entries.items() if now >= entry[1]]
+    if expired:
+        entries.update(reread_many(expired))
+    cards = {}
+    stale = {}
+    missing = []
+    locked = []
+    for post in posts:
+        key = keys[post.pk]
+        entry = entries.get(key)
+        if entry is not None:
+            card, fresh_until = entry
+            if now < fresh_until:
+                cards[key] = card
+                continue
+            if not acquire(key):
+                stale[key] = card
+                continue
+            locked.append(key)
+        missing.append(post)
+    if missing and prepare is not None:
+        prepare(missing)
+    rendered = {
+        keys[post.pk]: render_to_string(CARD_TEMPLATE, {'post': post})
+        for post in missing
+    }
+    record('hit', len(cards))
+    record('stale', len(stale))
+    record('rebuild', len(rendered))
+    cards.update(stale)
+    if rendered:
+        cache.set_many(
+            {key: wrap(card, CARD_TIMEOUT) for key, card in rendered.items()},
+            CARD_TIMEOUT + STALE_TIMEOUT,
+        )
+        cards.update(rendered)
+    for key in locked:
+        release(key)
+    return [(post, cards[keys[post.pk]]) for post in posts]
+
+
+INDEX_SCOPE = 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def profile_scope(username):
+    return f'profile:{username}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def feed_scopes(author, group_slugs=()):
+    """Области кэша страниц, где показываются посты автора."""
+    followers = Follow.objects.filter(
+        author_id=author.pk
+    ).values_list('user_id', flat=True)
+    return (
+        [INDEX_SCOPE, profile_scope(author.username)]
+        + [group_scope(slug) for slug in group_slugs if slug]
+        + [follow_scope(user_id) for user_id in followers.iterator()]
+    )
+
+
+def expire_posts(posts):
+    """Сбрасывает карточки и страницы, где показаны посты.
+
+    posts — queryset; авторы и группы подтягиваются одним запросом.
+    """
+    posts = posts.select_related('author', 'group')
+    bump_post_versions(posts.values_list('pk', flat=True))
+    for post in posts.iterator():
+        bump_generations(
+            feed_scopes(
+                post.author, [post.group.slug] if post.group_id else []
+            ) + [post_scope(post.pk)]
+        )
+
+
+def generation_key(scope):
+    # Имя пользователя может содержать символы, недопустимые в ключах
+    # memcached, поэтому область хэшируется.
+    return f'generation:{hashlib.md5(scope.encode()).hexdigest()}'
+
+
+def get_generations(scopes):
+    """Поколения областей кэша (лента, группа, профиль, подписки)."""
+    keys = {generation_key(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    found.update(init_versions([key for key in keys if key not in found]))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def bump_generations(scopes):
+    """Сдвигает поколения: страницы этих областей перестают совпадать
+    с ключами в кэше и будут отрисованы заново."""
+    generation = new_version()
+    cache.set_many(
+        {generation_key(scope): generation for scope in scopes},
+        VERSION_TIMEOUT,
+    )
+
+
+def require_scope(scope, find):
+    """Область существующего объекта.
+
+    Поколение заводится при первом чтении, поэтому до него find() ищет
+    объект и бросает Http404, если его нет: адреса вида
+    /group/<что угодно>/ не должны оставлять в кэше вечных ключей.
+    Заведённое поколение значит, что объект уже находили.
+    """
+    if cache.get(generation_key(scope)) is None:
+        find()
+    return scope
+
+
+def request_scopes(request, scopes, *args, **kwargs):
+    """Области страницы, посчитанные один раз за запрос: их читают
+    и условный GET, и кэш страницы."""
+    memo = request.__dict__.setdefault('_scopes', {})
+    if scopes not in memo:
+        memo[scopes] = scopes(request, *args, **kwargs)
+    return memo[scopes]
+
+
+def request_generations(request, scopes):
+    """Поколения областей, запомненные на время запроса.
+
+    ETag, Last-Modified и ключ кэша страницы считаются от одних и тех же
+    поколений, поэтому кэш опрашивается один раз за запрос.
+    """
+    memo = request.__dict__.setdefault('_generations', {})
+    missing = [scope for scope in scopes if scope not in memo]
+    if missing:
+        memo.update(get_generations(missing))
+    return [memo[scope] for scope in scopes]
+
+
+def get_group(slug):
+    """Группа по slug из кэша; ключ включает поколение группы."""
+    scope = group_scope(slug)
+    generation = cache.get(generation_key(scope))
+    group = None
+    if generation is not None:
+        group = cache.get(f'group:{slug}:{generation}')
+    if group is None:
+        try:
+            group = Group.objects.get(slug=slug)
+        except Group.DoesNotExist:
+            raise Http404('Группа не найдена')
+        # Поколение заводится только для найденной группы.
+        if generation is None:
+            generation = get_generations([scope])[scope]
+        cache.set(f'group:{slug}:{generation}', group, PAGE_TIMEOUT)
+    return group
+
+
+def page_key(request, generations):
+    # Адрес целиком, со схемой и хостом: ленты и API отдают абсолютные
+    # ссылки, собранные из запроса.
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    raw = '|'.join(
+        [request.build_absolute_uri(), str(user_id)]
+        + [str(g) for g in generations]
+    )
+    return f'page:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def cache_page_by_generation(scopes, timeout=PAGE_TIMEOUT):
+    """Аналог cache_page, ключ которого включает поколения областей.
+
+    scopes(request, *args, **kwargs) возвращает имена областей страницы.
+    Запись в любую из них меняет ключ, поэтому TTL может быть долгим,
+    а страница всё равно обновляется сразу после записи.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = page_key(
+                request,
+                request_generations(
+                    request, request_scopes(request, scopes, *args, **kwargs)
+                ),
+            )
+            response = None
+
+            def build():
+                nonlocal response
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.cookies:
+                    return response.content, response['Content-Type']
+                return None
+
+            cached = get_or_build(key, build, timeout)
+            if response is not None:
+                return response
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        return wrapper
+    return decorator
+
+
+def condition_by_generation(scopes, csrf=False):
+    """Условный GET (ETag, Last-Modified, 304) по поколениям областей.
+
+    Валидаторы считаются без запросов к базе, до выполнения вьюхи:
+    поколение меняется при каждой записи в область, а его значение —
+    это время этой записи.
+
+    csrf=True для страниц, где вошедшему пользователю показывается форма:
+    её токен зависит от куки CSRF, поэтому кука входит в ETag, а без куки
+    и по одной дате 304 такому пользователю не отдаётся.
+    """
+    def generations(request, *args, **kwargs):
+        if '_condition_generations' not in request.__dict__:
+            request._condition_generations = request_generations(
+                request, request_scopes(request, scopes, *args, **kwargs)
+            )
+        return request._condition_generations
+
+    def with_form(request):
+        return csrf and request.user.is_authenticated
+
+    def etag(request, *args, **kwargs):
+        key = page_key(request, generations(request, *args, **kwargs))
+        tag = key.split(':', 1)[1]
+        if not with_form(request):
+            return tag
+        cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+        if not cookie:
+            return None
+        return hashlib.md5(f'{tag}|{cookie}'.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if with_form(request):
+            return None
+        latest = max(generations(request, *args, **kwargs))
+        seconds = -(-latest // 10 ** 9)
+        return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import zlib
+
+from .models import Comment, Follow, Post
+from .storage import CHUNK_SIZE
+
+BATCH_SIZE = 2000
+# Поля записей совпадают с тем, что читает import_content.
+POST_FIELDS = (
+    'id', 'author__username', 'group__slug', 'text', 'pub_date', 'image',
+)
+COMMENT_FIELDS = (
+    'id', 'post_id', 'author__username', 'text', 'created', 'active',
+)
+FOLLOW_FIELDS = ('user__username', 'author__username')
+
+
+def rows(queryset, fields):
+    # iterator() читает курсором по chunk_size строк: память не растёт
+    # с размером таблицы, а в PostgreSQL курсор серверный.
+    return queryset.order_by('pk').values_list(*fields).iterator(
+        chunk_size=BATCH_SIZE
+    )
+
+
+def post_records(posts):
+    for post_id, author, group, text, pub_date, image in rows(
+        posts, POST_FIELDS
+    ):
+        yield {
+            'id': post_id,
+            'author': author,
+            'group': group,
+            'text': text,
+            'pub_date': pub_date.isoformat(),
+            'image': image,
+        }
+
+
+def comment_records(comments):
+    for comment_id, post_id, author, text, created, active in rows(
+        comments, COMMENT_FIELDS
+    ):
+        yield {
+            'id': comment_id,
+            'post': post_id,
+            'author': author,
+            'text': text,
+            'created': created.isoformat(),
+            'active': active,
+        }
+
+
+def follow_records(follows):
+    for user, author in rows(follows, FOLLOW_FIELDS):
+        yield {'user': user, 'author': author}
+
+
+def media_records(posts):
+    """Манифест картинок постов: имя, размер и SHA-256 содержимого.
+
+    Каждый файл читается кусками; отсутствующий отмечается missing.
+    """
+    storage = Post._meta.get_field('image').storage
+    names = posts.exclude(image='').order_by('image').values_list(
+        'image', flat=True
+    ).distinct().iterator(chunk_size=BATCH_SIZE)
+    for name in names:
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with storage.open(name, 'rb') as image:
+                for chunk in image.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+        except FileNotFoundError:
+            yield {'name': name, 'missing': True}
+            continue
+        yield {'name': name, 'size': size, 'sha256': digest.hexdigest()}
+
+
+def export_sets(since=None):
+    """Наборы выгрузки по именам файлов; since оставляет только записи
+    не старше этой даты (подписки даты не имеют и выгружаются целиком).
+    """
+    posts = Post.objects.all()
+    comments = Comment.objects.all()
+    if since is not None:
+        posts = posts.filter(pub_date__gte=since)
+        comments = comments.filter(created__gte=since)
+    return {
+        'posts': post_records(posts),
+        'comments': comment_records(comments),
+        'follows': follow_records(Follow.objects.all()),
+        'media': media_records(posts),
+    }
+
+
+def stream_jsonl_gz(records):
+    """Записи одной строкой JSON каждая, сжатые gzip, кусками байт."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
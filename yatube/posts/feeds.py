@@ -0,0 +1,124 @@
+from django.contrib.syndication.views import Feed
+from django.template.defaultfilters import truncatechars
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from .caching import (
+    cache_page_by_generation, condition_by_generation, get_group,
+)
+from .models import Post
+from .views import get_author, group_scopes, index_scopes, profile_scopes
+
+FEED_ITEMS = 20
+# Порядок тот же, что у лент в posts.views (см. CursorPaginator).
+ORDERING = ('-pub_date', '-id')
+
+
+class PostsFeed(Feed):
+    """Общая часть лент: последние посты в порядке страниц сайта.
+
+    Сами посты ленты подклассы отдают методом posts(obj).
+    """
+
+    def items(self, obj):
+        return self.posts(obj).select_related(
+            'author', 'group'
+        ).order_by(*ORDERING)[:FEED_ITEMS]
+
+    def item_title(self, post):
+        return truncatechars(post.text, 60)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('posts:post_detail', args=(post.pk,))
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_author_name(self, post):
+        return post.author.get_full_name() or post.author.username
+
+    def item_categories(self, post):
+        return (post.group.title,) if post.group_id else ()
+
+
+class IndexFeed(PostsFeed):
+    title = 'Yatube: последние записи'
+    description = subtitle = 'Последние обновления на сайте'
+
+    def link(self):
+        return reverse('posts:index')
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+
+class GroupFeed(PostsFeed):
+
+    def get_object(self, request, slug):
+        return get_group(slug)
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    subtitle = description
+
+    def link(self, group):
+        return reverse('posts:group_list', args=(group.slug,))
+
+    def posts(self, group):
+        return group.posts.all()
+
+
+class ProfileFeed(PostsFeed):
+
+    def get_object(self, request, username):
+        return get_author(request, username)
+
+    def title(self, author):
+        return f'Yatube: {author.get_full_name() or author.username}'
+
+    def description(self, author):
+        return f'Записи пользователя {author.username}'
+
+    subtitle = description
+
+    def link(self, author):
+        return reverse('posts:profile', args=(author.username,))
+
+    def posts(self, author):
+        return author.posts.all()
+
+
+# Atom берёт подзаголовок из subtitle, RSS — из description.
+class IndexAtomFeed(IndexFeed):
+    feed_type = Atom1Feed
+
+
+class GroupAtomFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+
+class ProfileAtomFeed(ProfileFeed):
+    feed_type = Atom1Feed
+
+
+def cached(feed, scopes):
+    """Лента из кэша страниц с условным GET: опрос без новых постов
+    стоит чтения поколений из кэша, без запросов к базе."""
+    return condition_by_generation(scopes)(
+        cache_page_by_generation(scopes)(feed)
+    )
+
+
+index_rss = cached(IndexFeed(), index_scopes)
+index_atom = cached(IndexAtomFeed(), index_scopes)
+group_rss = cached(GroupFeed(), group_scopes)
+group_atom = cached(GroupAtomFeed(), group_scopes)
+profile_rss = cached(ProfileFeed(), profile_scopes)
+profile_atom = cached(ProfileAtomFeed(), profile_scopes)
@@ -1,6 +1,11 @@
 from django import forms
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
 
-from .models import Post, Comment
+from .images import downscale_image
+from .models import Group, Post, Comment
+
+User = get_user_model()
 
 
 class PostForm(forms.ModelForm):
@@ -17,6 +22,13 @@ class PostForm(forms.ModelForm):
             'image': 'Картинка',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Проверяются только новые загрузки, а не уже сохранённый файл.
+        if isinstance(image, UploadedFile):
+            return downscale_image(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -28,3 +40,26 @@ class CommentForm(forms.ModelForm):
         labels = {
             'text': 'Коментарий',
         }
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Что искать', max_length=200)
+    group = forms.ModelChoiceField(
+        label='Группа',
+        queryset=Group.objects.all(),
+        to_field_name='slug',
+        required=False,
+        empty_label='Все группы',
+    )
+    author = forms.CharField(
+        label='Автор', max_length=150, required=False
+    )
+
+    def clean_author(self):
+        username = self.cleaned_data['author']
+        if not username:
+            return None
+        author = User.objects.filter(username=username).first()
+        if author is None:
+            raise forms.ValidationError('Такого автора нет.')
+        return author
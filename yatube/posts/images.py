@@ -0,0 +1,102 @@
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+# Что принимается при загрузке. Всё проверяется по заголовку файла,
+# без декодирования пикселей.
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+MAX_PIXELS = 50 * 1000 * 1000
+# Больше этой стороны оригиналы не хранятся: их уменьшают при загрузке.
+MAX_SIDE = 2560
+QUALITY = 85
+# До какого размера уменьшается картинка, чтобы найти её основной цвет.
+COLOR_SAMPLE = (64, 64)
+COLOR_PALETTE = 4
+
+EMPTY_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_format': '',
+    'image_size': None,
+    'image_color': '',
+}
+
+
+def dominant_color(image):
+    """Самый частый цвет картинки после сведения к малой палитре."""
+    palette = image.quantize(colors=COLOR_PALETTE)
+    count, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def read_image_metadata(file):
+    """Размеры, формат, объём в байтах и основной цвет картинки.
+
+    Размеры и формат берутся из заголовка. Для цвета картинка
+    декодируется уменьшенной: JPEG сразу в режиме draft.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image_format = image.format or ''
+        image.draft('RGB', COLOR_SAMPLE)
+        sample = image.convert('RGB')
+    sample.thumbnail(COLOR_SAMPLE)
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_format': image_format,
+        'image_size': file.size,
+        'image_color': dominant_color(sample),
+    }
+
+
+def check_image(file):
+    """Проверяет формат и размеры по заголовку, не декодируя картинку."""
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError('Файл не похож на картинку.')
+    finally:
+        file.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError(
+            f'Формат {image_format} не поддерживается: '
+            f'загрузите {", ".join(ALLOWED_FORMATS)}.'
+        )
+    if width * height > MAX_PIXELS:
+        raise ValidationError(
+            f'Картинка {width}x{height} слишком велика: '
+            f'не больше {MAX_PIXELS // 10 ** 6} мегапикселей.'
+        )
+    return image_format, width, height
+
+
+def downscale_image(file):
+    """Уменьшает оригинал до MAX_SIDE, если он больше.
+
+    JPEG декодируется сразу в уменьшенном виде (draft), поэтому память
+    на загрузку ограничена размером результата, а не оригинала.
+    Анимированные GIF сохраняются как есть.
+    """
+    image_format, width, height = check_image(file)
+    if max(width, height) <= MAX_SIDE or image_format == 'GIF':
+        return file
+    with Image.open(file) as image:
+        image.draft('RGB', (MAX_SIDE, MAX_SIDE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_SIDE, MAX_SIDE))
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = BytesIO()
+        image.save(output, image_format, quality=QUALITY, optimize=True)
+    return SimpleUploadedFile(
+        file.name, output.getvalue(), content_type=file.content_type
+    )
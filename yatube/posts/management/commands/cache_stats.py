@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import get_metrics, reset_metrics
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики кэша страниц и карточек постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода.',
+        )
+
+    def handle(self, *args, **options):
+        for name, value in get_metrics().items():
+            self.stdout.write(f'{name}: {value}')
+        if options['reset']:
+            reset_metrics()
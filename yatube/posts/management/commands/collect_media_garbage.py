@@ -0,0 +1,212 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts.caching import expire_posts
+from posts.models import ImageBlob, Post
+
+BATCH_SIZE = 500
+# Файл моложе этого может принадлежать загрузке, которая ещё
+# не зафиксирована в базе.
+MIN_AGE = 60 * 60
+
+
+def batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def walk(storage, directory):
+    """Файлы каталога хранилища: (имя, stat), по мере обхода."""
+    root = storage.path(directory)
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, storage.location)
+            yield name.replace(os.sep, '/'), os.stat(path)
+
+
+def thumbnail_sources():
+    """Исходники из хранилища ключей sorl со списками их миниатюр.
+
+    Выдаёт (исходник, [миниатюры]) пачками, не загружая всё хранилище.
+    """
+    keys = KVStore.objects.filter(
+        key__startswith=add_prefix('', 'thumbnails')
+    ).values_list('key', 'value')
+    for batch in batches(keys.iterator()):
+        thumbnail_keys = {
+            del_prefix(key): deserialize(value) or [] for key, value in batch
+        }
+        wanted = set(thumbnail_keys)
+        for keys_of_source in thumbnail_keys.values():
+            wanted.update(keys_of_source)
+        images = dict(KVStore.objects.filter(
+            key__in=[add_prefix(key) for key in wanted]
+        ).values_list('key', 'value'))
+        for source_key, keys_of_source in thumbnail_keys.items():
+            source = images.get(add_prefix(source_key))
+            if source is None:
+                continue
+            yield deserialize_image_file(source), [
+                deserialize_image_file(images[add_prefix(key)])
+                for key in keys_of_source if add_prefix(key) in images
+            ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки, на которые не ссылаются посты, и миниатюры, '
+        'о которых не знает sorl; ужимает кэш миниатюр до бюджета.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+        parser.add_argument(
+            '--thumbnail-budget', type=int, default=None,
+            help='Сколько байт могут занимать миниатюры; лишние '
+                 'вытесняются начиная с давно не использованных.',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.deadline = time.time() - options['min_age']
+        self.removed = self.freed = 0
+        self.collect_originals()
+        self.collect_sources()
+        self.collect_thumbnails()
+        if options['thumbnail_budget'] is not None:
+            self.evict_thumbnails(options['thumbnail_budget'])
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {self.removed}, байт: {self.freed}'
+        ))
+
+    def remove(self, image_file, size, reason):
+        self.stdout.write(f'{reason}: {image_file.name}')
+        self.removed += 1
+        self.freed += size
+        if not self.dry_run:
+            image_file.delete()
+
+    def collect_originals(self):
+        """Оригиналы, на которые не ссылается ни один пост."""
+        field = Post._meta.get_field('image')
+        files = (
+            (name, stat) for name, stat in walk(field.storage, field.upload_to)
+            if stat.st_mtime < self.deadline
+        )
+        for batch in batches(files):
+            referenced = set(Post.objects.filter(
+                image__in=[name for name, _ in batch]
+            ).values_list('image', flat=True))
+            for name, stat in batch:
+                if name in referenced:
+                    continue
+                image_file = ImageFile(name, field.storage)
+                if not self.dry_run:
+                    default.kvstore.delete(image_file)
+                    ImageBlob.objects.filter(name=name).delete()
+                self.remove(image_file, stat.st_size, 'оригинал')
+
+    def collect_sources(self):
+        """Миниатюры исходников, которых больше нет у постов."""
+        field = Post._meta.get_field('image')
+        for batch in batches(thumbnail_sources()):
+            referenced = set(Post.objects.filter(
+                image__in=[source.name for source, _ in batch]
+            ).values_list('image', flat=True))
+            for source, thumbnails in batch:
+                if source.name in referenced or not source.name.startswith(
+                    field.upload_to
+                ):
+                    continue
+                for thumbnail in thumbnails:
+                    if thumbnail.exists():
+                        self.remove(
+                            thumbnail,
+                            thumbnail.storage.size(thumbnail.name),
+                            'миниатюра без поста',
+                        )
+                if not self.dry_run:
+                    default.kvstore.delete(source)
+
+    def collect_thumbnails(self):
+        """Файлы миниатюр, о которых нет записи в хранилище ключей."""
+        files = (
+            (name, stat) for name, stat in walk(
+                default.storage, sorl_settings.THUMBNAIL_PREFIX
+            )
+            if stat.st_mtime < self.deadline
+        )
+        for batch in batches(files):
+            image_files = {
+                add_prefix(ImageFile(name, default.storage).key): (name, stat)
+                for name, stat in batch
+            }
+            known = set(KVStore.objects.filter(
+                key__in=list(image_files)
+            ).values_list('key', flat=True))
+            for key, (name, stat) in image_files.items():
+                if key not in known:
+                    self.remove(
+                        ImageFile(name, default.storage), stat.st_size,
+                        'миниатюра без записи',
+                    )
+
+    def evict_thumbnails(self, budget):
+        """Вытесняет миниатюры давно не показанных картинок.
+
+        Миниатюры одного исходника удаляются вместе: шаблоны выводят
+        картинку, только когда готовы все её варианты.
+        """
+        groups = []
+        total = 0
+        for source, thumbnails in thumbnail_sources():
+            size = last_used = 0
+            for thumbnail in thumbnails:
+                try:
+                    stat = os.stat(thumbnail.storage.path(thumbnail.name))
+                except FileNotFoundError:
+                    continue
+                size += stat.st_size
+                last_used = max(last_used, stat.st_atime, stat.st_mtime)
+            if size:
+                groups.append((last_used, size, source))
+                total += size
+        groups.sort(key=lambda group: group[0])
+        evicted = []
+        for last_used, size, source in groups:
+            if total <= budget:
+                break
+            total -= size
+            self.stdout.write(f'вытеснено: миниатюры {source.name}')
+            self.removed += 1
+            self.freed += size
+            if not self.dry_run:
+                default.kvstore.delete_thumbnails(source)
+            evicted.append(source.name)
+        if evicted and not self.dry_run:
+            # Вытеснены давно не читанные миниатюры, и сразу рисовать их
+            # заново незачем: карточка перерисуется при показе в ленте,
+            # и render_post_cards поставит задачу (страница поста — тоже).
+            expire_posts(Post.objects.filter(image__in=evicted))
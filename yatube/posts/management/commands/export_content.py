@@ -0,0 +1,78 @@
+import json
+import os
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts.export import export_sets, stream_jsonl_gz
+
+SUMMARY = 'export.json'
+
+
+def parse_since(value):
+    try:
+        since = parse_datetime(value)
+        day = parse_date(value) if since is None else None
+    except ValueError:
+        since = day = None
+    if since is None:
+        if day is None:
+            raise CommandError(f'Не разобрана дата --since: {value!r}')
+        since = datetime.combine(day, time.min)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты, комментарии, подписки и манифест картинок '
+        'в сжатые JSONL-файлы каталога, не загружая таблицы в память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог для выгрузки.')
+        parser.add_argument(
+            '--since', default=None,
+            help='Только посты и комментарии начиная с этой даты '
+                 '(ISO 8601). Удобно брать exported_at прошлой выгрузки '
+                 f'из {SUMMARY}.',
+        )
+
+    def handle(self, *args, **options):
+        since = options['since'] and parse_since(options['since'])
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+        exported_at = timezone.now()
+        counts = {}
+        for name, records in export_sets(since).items():
+            counts[name] = self.write(
+                os.path.join(directory, f'{name}.jsonl.gz'), records
+            )
+            self.stdout.write(f'{name}: {counts[name]}')
+        with open(os.path.join(directory, SUMMARY), 'w') as target:
+            json.dump({
+                'exported_at': exported_at.isoformat(),
+                'since': since.isoformat() if since else None,
+                'counts': counts,
+            }, target, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Выгрузка в {directory} готова'))
+
+    def write(self, path, records):
+        # Файл появляется под своим именем только целиком.
+        count = 0
+
+        def counted():
+            nonlocal count
+            for record in records:
+                count += 1
+                yield record
+
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as target:
+            for chunk in stream_jsonl_gz(counted()):
+                target.write(chunk)
+        os.replace(temporary, path)
+        return count
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import bump_post_versions
+from posts.images import read_image_metadata
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет сведения о картинках постов, загруженных раньше.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перечитать и картинки, сведения о которых уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only('image')
+        if not options['all']:
+            posts = posts.filter(image_width=None)
+        filled = []
+        failed = 0
+        for post in posts.iterator():
+            try:
+                with post.image.open('rb') as image:
+                    metadata = read_image_metadata(image)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{post.image.name}: {error}')
+                continue
+            Post.objects.filter(pk=post.pk).update(**metadata)
+            filled.append(post.pk)
+        bump_post_versions(filled)
+        self.stdout.write(self.style.SUCCESS(
+            f'Сведения о картинках заполнены: {len(filled)}, ошибок {failed}'
+        ))
@@ -0,0 +1,422 @@
+import csv
+import gzip
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.caching import (
+    INDEX_SCOPE, bump_generations, follow_scope, group_scope, post_scope,
+    profile_scope,
+)
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+# Поколения сдвигаются пачками, чтобы не собирать огромный set_many.
+SCOPES_BATCH = 500
+MODELS = {
+    'posts': Post,
+    'comments': Comment,
+    'follows': Follow,
+}
+TRUE_VALUES = ('1', 'true', 'yes', 'да')
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_records(path, format):
+    """Записи файла по одной: строки JSONL или CSV с заголовком.
+
+    Файл читается потоком; .gz распаковывается на лету. Испорченная
+    строка JSONL выдаётся как None, чтобы её можно было отклонить.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as source:
+        if format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else None
+
+
+def guess_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'jsonl'
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'не разобрана дата {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def parse_id(value):
+    return int(value) if value not in (None, '') else None
+
+
+def parse_bool(value, default=True):
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def object_key(obj):
+    """Ключ, по которому запись уже может быть в базе; None — нет такого."""
+    if isinstance(obj, Follow):
+        return obj.user_id, obj.author_id
+    return obj.pk
+
+
+def existing_keys(model, objects):
+    if model is Follow:
+        pairs = {object_key(obj) for obj in objects}
+        return pairs & set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            author_id__in={author_id for _, author_id in pairs},
+        ).values_list('user_id', 'author_id'))
+    return set(model.objects.filter(
+        pk__in={obj.pk for obj in objects if obj.pk is not None}
+    ).values_list('pk', flat=True))
+
+
+def insert_new(model, objects):
+    """Вставляет записи, которых ещё нет в базе; возвращает их число.
+
+    Значения полей пишутся как есть, как при loaddata: bulk_create
+    подставил бы в поля auto_now_add текущее время вместо дат из файла.
+    """
+    seen = existing_keys(model, objects)
+    new = []
+    for obj in objects:
+        key = object_key(obj)
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        new.append(obj)
+    manager = model._base_manager
+    meta = model._meta
+    for with_pk in (True, False):
+        chunk = [obj for obj in new if (obj.pk is not None) == with_pk]
+        fields = [
+            field for field in meta.concrete_fields
+            if with_pk or field is not meta.pk
+        ]
+        size = connection.ops.bulk_batch_size(fields, chunk) or 1
+        for part in batches(chunk, size):
+            # ignore_conflicts — на случай записи, вставленной кем-то
+            # между проверкой и вставкой.
+            manager._insert(
+                part, fields=fields, raw=True, ignore_conflicts=True
+            )
+    return len(new)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты, комментарии или подписки из JSONL или CSV '
+        'пачками, по запросу на пачку. Прерванную загрузку можно продолжить '
+        'с последней сохранённой пачки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS))
+        parser.add_argument(
+            'path',
+            help='Файл .jsonl или .csv, можно сжатый gzip (.gz).',
+        )
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'), default=None,
+            help='Формат файла; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Записей в одной транзакции.',
+        )
+        parser.add_argument(
+            '--checkpoint', default=None,
+            help='Файл контрольной точки; по умолчанию <path>.checkpoint.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, не глядя на контрольную точку.',
+        )
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Создавать неизвестных пользователей и группы.',
+        )
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересчитывать счётчики, ленты и кэш страниц — '
+                 'например, если дальше загружается ещё один файл.',
+        )
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным.')
+        self.model_name = options['model']
+        self.model = MODELS[self.model_name]
+        self.create_missing = options['create_missing']
+        self.checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        self.touched_users = set()
+        self.touched_groups = set()
+        self.touched_posts = set()
+        self.imported = self.rejected = 0
+
+        start = 0 if options['restart'] else self.load_checkpoint(path)
+        records = enumerate(
+            read_records(path, options['format'] or guess_format(path)), 1
+        )
+        self.skip(records, start)
+        self.load(path, records, start, options['batch_size'])
+        self.reset_sequences()
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        if not options['skip_derived']:
+            self.rebuild_derived()
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка завершена: загружено {self.imported}, '
+            f'отклонено {self.rejected}'
+        ))
+
+    def skip(self, records, count):
+        """Пропускает записи, загруженные прошлым запуском, но помнит,
+        что они затронули: производные пересчитываются и для них."""
+        for number, record in islice(records, count):
+            try:
+                self.touch(record)
+            except (AttributeError, ValueError, TypeError):
+                pass
+        if count:
+            self.stdout.write(f'Продолжаем после записи {count}')
+
+    def load(self, path, records, start, batch_size):
+        started = time.monotonic()
+        for batch in batches(records, batch_size):
+            objects = self.build_batch(batch)
+            with transaction.atomic():
+                self.imported += insert_new(self.model, objects)
+            position = batch[-1][0]
+            self.save_checkpoint(path, position)
+            elapsed = time.monotonic() - started
+            rate = (position - start) / elapsed if elapsed else 0
+            self.stdout.write(
+                f'{self.model_name}: прочитано {position}, '
+                f'загружено {self.imported}, отклонено {self.rejected}, '
+                f'{rate:.0f} записей/с'
+            )
+
+    def build_batch(self, batch):
+        """Объекты моделей для пачки (номер, запись); негодные записи
+        отклоняются с сообщением."""
+        build = getattr(self, f'build_{self.model_name[:-1]}')
+        objects = []
+        for number, record in batch:
+            try:
+                if record is None:
+                    raise ValueError('не разобрана строка')
+                objects.append((number, build(record)))
+                self.touch(record)
+            except (KeyError, ValueError, TypeError) as error:
+                self.reject(number, error)
+        return [obj for _, obj in self.check_references(objects)]
+
+    def load_checkpoint(self, path):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as source:
+                checkpoint = json.load(source)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            raise CommandError(
+                f'Испорчена контрольная точка {self.checkpoint_path}; '
+                'запустите с --restart.'
+            )
+        if (checkpoint.get('source'), checkpoint.get('model')) != (
+            path, self.model_name
+        ):
+            raise CommandError(
+                f'Контрольная точка {self.checkpoint_path} относится к '
+                'другой загрузке; запустите с --restart.'
+            )
+        self.imported = checkpoint.get('imported', 0)
+        self.rejected = checkpoint.get('rejected', 0)
+        return checkpoint['position']
+
+    def save_checkpoint(self, path, position):
+        # Пишем во временный файл и подменяем: обрыв посреди записи
+        # не испортит предыдущую точку.
+        temporary = f'{self.checkpoint_path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump({
+                'source': path,
+                'model': self.model_name,
+                'position': position,
+                'imported': self.imported,
+                'rejected': self.rejected,
+            }, target)
+        os.replace(temporary, self.checkpoint_path)
+
+    def reject(self, number, error):
+        self.rejected += 1
+        self.stderr.write(f'Запись {number} пропущена: {error}')
+
+    def user_id(self, username):
+        if not username:
+            raise ValueError('не указан пользователь')
+        if username not in self.users:
+            if not self.create_missing:
+                raise ValueError(f'нет пользователя {username!r}')
+            user = User(username=username)
+            user.set_unusable_password()
+            user.save()
+            self.users[username] = user.pk
+        return self.users[username]
+
+    def group_id(self, slug):
+        if not slug:
+            return None
+        if slug not in self.groups:
+            if not self.create_missing:
+                raise ValueError(f'нет группы {slug!r}')
+            self.groups[slug] = Group.objects.create(title=slug, slug=slug).pk
+        return self.groups[slug]
+
+    def build_post(self, record):
+        if not record.get('text'):
+            raise ValueError('пустой текст')
+        return Post(
+            id=parse_id(record.get('id')),
+            text=record['text'],
+            author_id=self.user_id(record.get('author')),
+            group_id=self.group_id(record.get('group')),
+            pub_date=parse_date(record.get('pub_date')),
+            image=record.get('image') or '',
+        )
+
+    def build_comment(self, record):
+        if not record.get('text'):
+            raise ValueError('пустой текст')
+        return Comment(
+            id=parse_id(record.get('id')),
+            post_id=int(record['post']),
+            author_id=self.user_id(record.get('author')),
+            text=record['text'],
+            created=parse_date(record.get('created')),
+            active=parse_bool(record.get('active')),
+        )
+
+    def build_follow(self, record):
+        user_id = self.user_id(record.get('user'))
+        author_id = self.user_id(record.get('author'))
+        if user_id == author_id:
+            raise ValueError('подписка на самого себя')
+        return Follow(user_id=user_id, author_id=author_id)
+
+    def check_references(self, objects):
+        """Отбрасывает комментарии к постам, которых нет в базе;
+        objects — пары (номер записи, объект)."""
+        if self.model is not Comment:
+            return objects
+        existing = set(Post.objects.filter(
+            pk__in={comment.post_id for _, comment in objects}
+        ).values_list('pk', flat=True))
+        kept = []
+        for number, comment in objects:
+            if comment.post_id in existing:
+                kept.append((number, comment))
+            else:
+                self.reject(number, f'нет поста {comment.post_id}')
+        return kept
+
+    def touch(self, record):
+        """Запоминает, чьи ленты и страницы затронет запись."""
+        if self.model is Post:
+            self.touched_users.add(record.get('author'))
+            self.touched_groups.add(record.get('group'))
+        elif self.model is Comment:
+            self.touched_posts.add(parse_id(record.get('post')))
+        else:
+            self.touched_users.update(
+                (record.get('user'), record.get('author'))
+            )
+
+    def reset_sequences(self):
+        # Посты и комментарии могли прийти со своими id; как и loaddata,
+        # сдвигаем последовательности за них (для SQLite ничего не нужно).
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [self.model]
+        )
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def rebuild_derived(self):
+        """Пересчитывает то, что при обычной записи делают сигналы:
+        вставка пачками их не вызывает. Поисковый индекс следит за
+        таблицей постов сам, триггерами."""
+        call_command('repair_counters', stdout=self.stdout)
+        usernames = {name for name in self.touched_users if name}
+        readers = set()
+        if self.model is Post:
+            for chunk in batches(usernames, SCOPES_BATCH):
+                readers.update(Follow.objects.filter(
+                    author__username__in=chunk
+                ).values_list('user__username', flat=True))
+        elif self.model is Follow:
+            readers = usernames
+        if readers:
+            call_command('rebuild_timelines', *readers, stdout=self.stdout)
+        scopes = [INDEX_SCOPE] if self.model is Post else []
+        scopes += [profile_scope(name) for name in usernames]
+        scopes += [
+            group_scope(slug) for slug in self.touched_groups if slug
+        ]
+        scopes += [
+            post_scope(post_id) for post_id in self.touched_posts
+            if post_id is not None
+        ]
+        for chunk in batches(readers, SCOPES_BATCH):
+            scopes += [
+                follow_scope(user_id) for user_id in User.objects.filter(
+                    username__in=chunk
+                ).values_list('id', flat=True)
+            ]
+        for chunk in batches(scopes, SCOPES_BATCH):
+            bump_generations(chunk)
@@ -0,0 +1,73 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.caching import expire_posts
+from posts.models import ImageBlob, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище с именами по содержимому '
+        'и пересчитывает ссылки на файлы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет перенесено.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        dry_run = options['dry_run']
+        moved = {}
+        missing = set()
+        posts = Post.objects.exclude(image='').values_list('pk', 'image')
+        for post_id, name in posts.iterator():
+            if storage.is_hashed(name) or name in missing:
+                continue
+            if name not in moved:
+                if not storage.exists(name):
+                    missing.add(name)
+                    self.stderr.write(f'Нет файла: {name}')
+                    continue
+                if dry_run:
+                    moved[name] = name
+                else:
+                    with storage.open(name) as content:
+                        moved[name] = storage.save(name, content)
+            self.stdout.write(f'{name} -> {moved[name]}')
+            if not dry_run:
+                Post.objects.filter(pk=post_id).update(image=moved[name])
+        if dry_run:
+            self.stdout.write(f'Будет перенесено файлов: {len(moved)}')
+            return
+        for name in moved:
+            storage.delete(name)
+        # Счётчики ссылок собираются заново, в том числе для файлов,
+        # которые уже лежали по хэшу.
+        ImageBlob.objects.all().delete()
+        ImageBlob.objects.bulk_create(
+            (
+                ImageBlob(name=name, refcount=refcount)
+                for name, refcount in Post.objects.exclude(
+                    image=''
+                ).values_list('image').annotate(refcount=Count('pk'))
+                .order_by().iterator()
+                if storage.is_hashed(name)
+            ),
+            batch_size=500,
+        )
+        # Закэшированные карточки и страницы ссылаются на старые имена,
+        # а миниатюры sorl привязаны к имени исходника: рисуем заново.
+        renamed = Post.objects.filter(image__in=set(moved.values()))
+        expire_posts(renamed)
+        post_ids = [str(pk) for pk in renamed.values_list('pk', flat=True)]
+        if post_ids:
+            call_command(
+                'pregenerate_thumbnails', *post_ids, stdout=self.stdout
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {len(moved)}, не найдено: {len(missing)}'
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from sorl.thumbnail.images import ImageFile
+
+from posts.caching import acquire
+from posts.models import Post
+from posts.thumbnails import JOB_LOCK_TIMEOUT, job_key, job_scopes, run
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Рисует недостающие миниатюры картинок постов: загруженных до '
+        'смены размеров, импортированных, после сбоя фоновой задачи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'post_ids', nargs='*', type=int,
+            help='Только эти посты; по умолчанию все с картинками.',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').select_related(
+            'author', 'group'
+        ).order_by('-pk')
+        if options['post_ids']:
+            posts = posts.filter(pk__in=options['post_ids'])
+        drawn = skipped = 0
+        for post in posts.iterator(chunk_size=BATCH_SIZE):
+            # Задачу поста могла уже взять страница или сигнал.
+            if not acquire(job_key(post.pk), JOB_LOCK_TIMEOUT):
+                skipped += 1
+                continue
+            # run снимет блокировку и сбросит кэш страниц поста.
+            if run(post.pk, ImageFile(post.image), job_scopes(post)):
+                drawn += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры нарисованы для постов: {drawn}, '
+            f'пропущено занятых: {skipped}'
+        ))
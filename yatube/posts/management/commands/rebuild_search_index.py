@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import install
+
+
+class Command(BaseCommand):
+    help = 'Восстанавливает триггеры поиска и перестраивает индекс FTS5.'
+
+    def handle(self, *args, **options):
+        install(rebuild=True)
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
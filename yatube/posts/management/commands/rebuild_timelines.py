@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.caching import bump_generations, follow_scope
+from posts.models import Follow, Post, Timeline
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок пользователей из таблицы подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пересобрать ленты только этих пользователей.',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            missing = set(options['usernames']) - set(
+                users.values_list('username', flat=True)
+            )
+            if missing:
+                raise CommandError(
+                    f'Пользователи не найдены: {", ".join(sorted(missing))}'
+                )
+        entries = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            entries += self.rebuild(user_id)
+            # Лента подписок отдаётся из кэша по поколению пользователя:
+            # без сдвига осталась бы страница, собранная до пересборки.
+            bump_generations([follow_scope(user_id)])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, записей: {entries}'
+        ))
+
+    @transaction.atomic
+    def rebuild(self, user_id):
+        Timeline.objects.filter(user_id=user_id).delete()
+        authors = Follow.objects.filter(user_id=user_id).values('author_id')
+        posts = Post.objects.filter(
+            author_id__in=authors
+        ).values_list('id', 'pub_date')
+        created = Timeline.objects.bulk_create(
+            (
+                Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+                for post_id, pub_date in posts.iterator()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        return len(created)
@@ -0,0 +1,67 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.caching import bump_generations, profile_scope
+from posts.management.commands.import_content import SCOPES_BATCH, batches
+from posts.models import Comment, Post, UserStats, count_subquery
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает хранимые счётчики постов, подписок и комментариев.'
+
+    def handle(self, *args, **options):
+        posts, stats, changed = self.recount()
+        # Счётчики пользователя показываются на страницах, закэшированных
+        # по поколению его профиля; сдвигаем его, когда числа изменились.
+        for chunk in batches(changed, SCOPES_BATCH):
+            bump_generations([
+                profile_scope(username) for username in User.objects.filter(
+                    pk__in=chunk
+                ).values_list('username', flat=True)
+            ])
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: постов {posts}, '
+            f'пользователей {stats}, изменилось {len(changed)}'
+        ))
+
+    @transaction.atomic
+    def recount(self):
+        """Пересчитывает счётчики; возвращает число постов, число
+        пользователей и id пользователей с изменившимися счётчиками."""
+        posts = Post.objects.update(
+            comments_count=count_subquery(Comment, 'post', active=True)
+        )
+        fields = ('posts_count', 'followers_count', 'following_count')
+        previous = {
+            user_id: counts for user_id, *counts
+            in UserStats.objects.values_list('user_id', *fields).iterator()
+        }
+        UserStats.objects.all().delete()
+        users = UserStats.counted().values_list(
+            'pk', 'posts_total', 'followers_total', 'following_total'
+        )
+        changed = []
+
+        def recounted():
+            for user_id, *counts in users.iterator():
+                # Без строки счётчиков страницы не рисовались: for_user
+                # пересчитал бы и сохранил их.
+                if user_id in previous and previous[user_id] != counts:
+                    changed.append(user_id)
+                posts_total, followers_total, following_total = counts
+                yield UserStats(
+                    user_id=user_id,
+                    posts_count=posts_total,
+                    followers_count=followers_total,
+                    following_count=following_total,
+                )
+
+        stats = UserStats.objects.bulk_create(
+            recounted(), batch_size=BATCH_SIZE
+        )
+        return posts, len(stats), changed
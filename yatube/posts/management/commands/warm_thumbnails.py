@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+
+
+class Command(BaseCommand):
+    help = 'Загружает сведения о миниатюрах из базы в кэш.'
+
+    def handle(self, *args, **options):
+        if not hasattr(default.kvstore, 'warm'):
+            raise CommandError(
+                'THUMBNAIL_KVSTORE не поддерживает прогрев: '
+                'укажите posts.kvstore.KVStore.'
+            )
+        count = default.kvstore.warm()
+        self.stdout.write(self.style.SUCCESS(
+            f'В кэш загружено записей: {count}'
+        ))
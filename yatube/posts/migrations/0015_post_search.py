@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install_index(apps, schema_editor):
+    from posts.search import install
+    install(schema_editor.connection)
+
+
+def uninstall_index(apps, schema_editor):
+    from posts.search import uninstall
+    uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, uninstall_index),
+    ]
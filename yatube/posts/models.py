@@ -1,5 +1,9 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .storage import ContentAddressedStorage
 
 
 class Group(models.Model):
@@ -37,6 +41,7 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
     group = models.ForeignKey(
@@ -48,11 +53,57 @@ class Post(models.Model):
         verbose_name="Группа",
         help_text="Выберите название группы"
     )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число активных комментариев',
+        default=0,
+        editable=False,
+    )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        null=True,
+        editable=False,
+    )
+    image_format = models.CharField(
+        verbose_name='Формат картинки',
+        max_length=10,
+        blank=True,
+        editable=False,
+    )
+    image_size = models.PositiveIntegerField(
+        verbose_name='Размер картинки, байт',
+        null=True,
+        editable=False,
+    )
+    image_color = models.CharField(
+        verbose_name='Основной цвет картинки',
+        max_length=7,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Статья'
         verbose_name_plural = 'Статьи'
+        indexes = (
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='post_pub_date_id_idx',
+            ),
+        )
 
     def __str__(self):
         return self.text[:15]
@@ -89,6 +140,14 @@ class Comment(models.Model):
         ordering = ['-created']
         verbose_name_plural = 'Комментарии'
         verbose_name = 'Комментарий'
+        indexes = (
+            # Страница поста показывает только активные комментарии.
+            models.Index(
+                fields=('post', '-created', '-id'),
+                name='comment_post_active_idx',
+                condition=models.Q(active=True),
+            ),
+        )
 
     def __str__(self):
         return self.text[:15]
@@ -120,6 +179,191 @@ class Follow(models.Model):
                 name='unique_follows',
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('author', 'user'),
+                name='follow_author_user_idx',
+            ),
+        )
 
     def __str__(self) -> str:
         return f'{self.user.username} подписан на {self.author.username}'
+
+
+class Timeline(models.Model):
+    """Лента подписок пользователя, заполняемая при публикации поста.
+
+    Дата публикации продублирована из поста, чтобы лента читалась
+    одним проходом по индексу (user, -pub_date, -post).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_pub_date_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+def count_subquery(model, field, **filters):
+    """Подзапрос COUNT(*) по model.field = OuterRef('pk') и filters."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}, **filters
+        ).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class UserStats(models.Model):
+    """Хранимые счётчики пользователя.
+
+    Поддерживаются сигналами при записи постов и подписок, так что
+    страницы профиля и поста не выполняют агрегирующих запросов.
+    Пересчитать всё разом можно командой repair_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+    @classmethod
+    def counted(cls):
+        """Пользователи с заново посчитанными счётчиками."""
+        return User.objects.annotate(
+            posts_total=count_subquery(Post, 'author'),
+            followers_total=count_subquery(Follow, 'author'),
+            following_total=count_subquery(Follow, 'user'),
+        )
+
+    @classmethod
+    def for_user(cls, user):
+        """Счётчики пользователя; отсутствующие пересчитываются."""
+        try:
+            return user.stats
+        except cls.DoesNotExist:
+            return cls.recount(user.pk)
+
+    @classmethod
+    def recount(cls, user_id):
+        user = cls.counted().get(pk=user_id)
+        stats, _ = cls.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                'posts_count': user.posts_total,
+                'followers_count': user.followers_total,
+                'following_count': user.following_total,
+            },
+        )
+        return stats
+
+    @classmethod
+    def bump(cls, user_id, **deltas):
+        """Атомарно сдвигает счётчики, не опуская их ниже нуля.
+
+        Строки нет — при росте она пересчитывается, при убыли ничего
+        не делается: убыль приходит и из каскадного удаления самого
+        пользователя, и пересоздавать его счётчики тогда нельзя.
+        Пропущенную строку позже пересчитает for_user.
+        """
+        updated = cls.objects.filter(user_id=user_id).update(**{
+            field: Greatest(F(field) + delta, 0)
+            for field, delta in deltas.items()
+        })
+        if updated or any(delta < 0 for delta in deltas.values()):
+            return
+        if User.objects.filter(pk=user_id).exists():
+            cls.recount(user_id)
+
+
+class ImageBlob(models.Model):
+    """Число постов, ссылающихся на файл картинки.
+
+    Одинаковые картинки хранятся одним файлом (ContentAddressedStorage);
+    файл удаляется, когда на него не остаётся ссылок.
+    """
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=100,
+        primary_key=True,
+    )
+    refcount = models.PositiveIntegerField(
+        verbose_name='Число ссылок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def recount(cls, name):
+        refcount = Post.objects.filter(image=name).count()
+        cls.objects.update_or_create(
+            name=name, defaults={'refcount': refcount}
+        )
+        return refcount
+
+    @classmethod
+    def bump(cls, name, delta):
+        """Атомарно сдвигает счётчик и возвращает новое значение;
+        строки нет — пересчитывает её."""
+        if not cls.objects.filter(name=name, refcount__gte=-delta).update(
+            refcount=F('refcount') + delta
+        ):
+            return cls.recount(name)
+        return cls.objects.values_list('refcount', flat=True).get(name=name)
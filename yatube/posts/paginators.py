@@ -0,0 +1,120 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (keyset): без COUNT(*) и без OFFSET.
+
+    Страница выбирается условием по ключам сортировки последней
+    (или первой) записи предыдущей страницы, поэтому стоимость запроса
+    не зависит от глубины страницы. Все ключи сортируются по убыванию.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 transform=None):
+        self.keys = tuple(keys)
+        self.transform = transform
+        self.next_cursor = None
+        self.previous_cursor = None
+        # Сортируем по столбцам, а не по связям: order_by('-post')
+        # подтянул бы сортировку по умолчанию связанной модели.
+        meta = object_list.model._meta
+        self.columns = tuple(meta.get_field(key).attname for key in keys)
+        super().__init__(
+            object_list.order_by(*(f'-{column}' for column in self.columns)),
+            per_page,
+        )
+
+    @property
+    def num_pages(self):
+        # Номер страницы в режиме курсора условный: 2, если есть более
+        # новые записи, и на единицу больше, если есть более старые.
+        # Этого достаточно, чтобы has_next/has_previous у Page работали.
+        number = 2 if self.previous_cursor else 1
+        return number + 1 if self.next_cursor else number
+
+    def encode_cursor(self, obj):
+        fields = [self._get_field(key) for key in self.keys]
+        values = [
+            field.value_to_string(obj) if field.get_internal_type() in (
+                'DateTimeField', 'DateField'
+            ) else getattr(obj, field.attname)
+            for field in fields
+        ]
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Разбирает курсор; для испорченного значения возвращает None."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if len(values) != len(self.keys):
+                return None
+            return [
+                self._get_field(key).to_python(value)
+                for key, value in zip(self.keys, values)
+            ]
+        except (ValueError, TypeError, AttributeError, ValidationError):
+            return None
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу старше курсора after или новее before.
+
+        Без курсоров (или с испорченным курсором) отдаётся первая
+        страница, как это делает Paginator.get_page.
+        """
+        values = None
+        newer = False
+        if before:
+            values = self.decode_cursor(before)
+            newer = values is not None
+        if values is None and after:
+            values = self.decode_cursor(after)
+        queryset = self.object_list
+        if values is not None:
+            lookup = 'gt' if newer else 'lt'
+            queryset = queryset.filter(self._seek(values, lookup))
+            if newer:
+                queryset = queryset.reverse()
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if newer:
+            rows.reverse()
+        if rows:
+            if newer:
+                self.previous_cursor = (
+                    self.encode_cursor(rows[0]) if has_more else None
+                )
+                self.next_cursor = self.encode_cursor(rows[-1])
+            else:
+                self.previous_cursor = (
+                    self.encode_cursor(rows[0]) if values else None
+                )
+                self.next_cursor = (
+                    self.encode_cursor(rows[-1]) if has_more else None
+                )
+        object_list = rows
+        if self.transform is not None:
+            object_list = [self.transform(row) for row in rows]
+        number = 2 if self.previous_cursor else 1
+        return self._get_page(object_list, number, self)
+
+    def _get_field(self, key):
+        return self.object_list.model._meta.get_field(key)
+
+    def _seek(self, values, lookup):
+        """Условие (k1, k2, ...) < (v1, v2, ...) в развёрнутом виде."""
+        conditions = []
+        for index, column in enumerate(self.columns):
+            equal = dict(zip(self.columns[:index], values[:index]))
+            equal[f'{column}__{lookup}'] = values[index]
+            conditions.append(Q(**equal))
+        return reduce(or_, conditions)
@@ -0,0 +1,213 @@
+import base64
+import json
+
+from django.db import DatabaseError, connection, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+TABLE = 'posts_post_fts'
+SNIPPET_TOKENS = 16
+# Границы совпадения в сниппете: управляющие символы не встречаются
+# в тексте поста, поэтому их можно заменить на <mark> после экранирования.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+CREATE_TABLE = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON posts_post
+    BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+REBUILD = f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"
+
+
+def is_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection, rebuild=False):
+    """Создаёт индекс FTS5 и триггеры, которые держат его в актуальном
+    состоянии; существующие не трогает.
+
+    Вызывается и после каждой миграции: пересоздавая таблицу постов
+    при изменении схемы, SQLite удаляет её триггеры.
+    """
+    if (not is_available(using) or Post._meta.db_table
+            not in using.introspection.table_names()):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [TABLE],
+        )
+        created = cursor.fetchone() is None
+        cursor.execute(CREATE_TABLE)
+        for trigger in TRIGGERS:
+            cursor.execute(trigger)
+        if created or rebuild:
+            cursor.execute(REBUILD)
+
+
+def uninstall(using=connection):
+    if not is_available(using):
+        return
+    with using.cursor() as cursor:
+        for suffix in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def match_expression(query):
+    """Запрос пользователя в виде выражения FTS5 без операторов:
+    каждое слово ищется как префикс, все слова должны встретиться."""
+    terms = (term.replace('"', '""') for term in query.split())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def encode_cursor(rank, post_id):
+    raw = json.dumps([rank, post_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, post_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(rank), int(post_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def fallback_search(query, per_page, group_id, author_id):
+    """Поиск подстрокой для баз без FTS5: без ранжирования и страниц."""
+    posts = Post.objects.filter(text__icontains=query.strip())
+    if group_id is not None:
+        posts = posts.filter(group_id=group_id)
+    if author_id is not None:
+        posts = posts.filter(author_id=author_id)
+    posts = list(posts.select_related('author', 'group')[:per_page])
+    for post in posts:
+        post.snippet = post.text[:200]
+    return posts
+
+
+def search_sql(expression, per_page, group_id, author_id, position):
+    """SQL и параметры страницы выдачи FTS5 после position."""
+    sql = [
+        f"""
+        SELECT {TABLE}.rowid, {TABLE}.rank,
+               snippet({TABLE}, 0, %s, %s, '…', %s)
+        FROM {TABLE} JOIN posts_post ON posts_post.id = {TABLE}.rowid
+        WHERE {TABLE} MATCH %s
+        """
+    ]
+    params = [MARK_START, MARK_END, SNIPPET_TOKENS, expression]
+    if group_id is not None:
+        sql.append('AND posts_post.group_id = %s')
+        params.append(group_id)
+    if author_id is not None:
+        sql.append('AND posts_post.author_id = %s')
+        params.append(author_id)
+    if position is not None:
+        rank, post_id = position
+        sql.append(
+            f'AND ({TABLE}.rank > %s '
+            f'OR ({TABLE}.rank = %s AND {TABLE}.rowid < %s))'
+        )
+        params += [rank, rank, post_id]
+    sql.append(f'ORDER BY {TABLE}.rank, {TABLE}.rowid DESC LIMIT %s')
+    params.append(per_page + 1)
+    return ' '.join(sql), params
+
+
+def fetch_rows(sql, params):
+    """Строки выдачи (id, rank, snippet); индекса нет или выражение
+    не разобралось — ищем как ничего."""
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+    except DatabaseError:
+        return []
+
+
+def hydrate(rows):
+    """Посты для строк выдачи в их порядке, со сниппетами."""
+    found = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for post_id, _, _ in rows]
+    )
+    posts = []
+    for post_id, _, snippet in rows:
+        post = found.get(post_id)
+        if post is not None:
+            post.snippet = highlight(snippet)
+            posts.append(post)
+    return posts
+
+
+def search_posts(query, per_page, group_id=None, author_id=None, after=None):
+    """Посты по запросу, самые подходящие первыми, и курсор следующей
+    страницы (или None).
+
+    У каждого поста заполнен snippet — фрагмент текста с выделенными
+    совпадениями. Страницы листаются по (rank, id), поэтому глубина
+    страницы не влияет на стоимость запроса.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return [], None
+    if not is_available():
+        return fallback_search(query, per_page, group_id, author_id), None
+    position = decode_cursor(after) if after else None
+    rows = fetch_rows(*search_sql(
+        expression, per_page, group_id, author_id, position
+    ))
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return hydrate(rows), next_cursor
+
+
+def matching_ids(query):
+    """SQL подзапроса с id постов по запросу — для фильтра queryset."""
+    return (
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+        [match_expression(query)],
+    )
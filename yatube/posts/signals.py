@@ -0,0 +1,282 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.db import transaction
+from django.dispatch import receiver
+
+from .caching import (
+    INDEX_SCOPE, bump_generations, bump_post_versions, feed_scopes,
+    follow_scope, group_scope, post_scope, profile_scope,
+)
+from .images import EMPTY_METADATA, read_image_metadata
+from .models import (
+    Comment, Follow, Group, ImageBlob, Post, Timeline, UserStats,
+)
+from .thumbnails import schedule as schedule_thumbnails
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if not created or raw:
+        return
+    followers = Follow.objects.filter(
+        author_id=instance.author_id
+    ).values_list('user_id', flat=True)
+    # Запись могла уже появиться из backfill_timeline параллельной подписки.
+    Timeline.objects.bulk_create(
+        (
+            Timeline(
+                user_id=user_id, post=instance, pub_date=instance.pub_date
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    if not created or raw:
+        return
+    posts = Post.objects.filter(
+        author_id=instance.author_id
+    ).values_list('id', 'pub_date')
+    Timeline.objects.bulk_create(
+        (
+            Timeline(user_id=instance.user_id, post_id=post_id,
+                     pub_date=pub_date)
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    Timeline.objects.filter(
+        user_id=instance.user_id,
+        post__author_id=instance.author_id,
+    ).delete()
+
+
+@receiver(post_save, sender=Post)
+def count_post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.bump(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_post_deleted(sender, instance, **kwargs):
+    UserStats.bump(instance.author_id, posts_count=-1)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_active(sender, instance, raw=False, **kwargs):
+    # Счётчик поста учитывает только активные комментарии, поэтому
+    # скрытие и возврат комментария тоже его сдвигают.
+    instance._was_active = False
+    if instance.pk is not None and not raw:
+        instance._was_active = Comment.objects.filter(
+            pk=instance.pk, active=True
+        ).exists()
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_saved(sender, instance, raw=False, **kwargs):
+    delta = int(instance.active) - int(instance._was_active)
+    if delta and not raw:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=Greatest(F('comments_count') + delta, 0)
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_comment_deleted(sender, instance, **kwargs):
+    if instance.active:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=Greatest(F('comments_count') - 1, 0)
+        )
+
+
+@receiver(post_save, sender=Follow)
+def count_follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.bump(instance.author_id, followers_count=1)
+        UserStats.bump(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_follow_deleted(sender, instance, **kwargs):
+    UserStats.bump(instance.author_id, followers_count=-1)
+    UserStats.bump(instance.user_id, following_count=-1)
+
+
+@receiver(pre_save, sender=Post)
+def capture_image_metadata(sender, instance, raw=False, **kwargs):
+    # Сведения о картинке читаются один раз, пока загрузка ещё в памяти.
+    if raw:
+        return
+    if not instance.image:
+        metadata = EMPTY_METADATA
+    elif not instance.image._committed:
+        try:
+            metadata = read_image_metadata(instance.image)
+        except (OSError, ValueError):
+            metadata = EMPTY_METADATA
+    else:
+        return
+    for field, value in metadata.items():
+        setattr(instance, field, value)
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_thumbnails(sender, instance, raw=False, **kwargs):
+    # Миниатюры рисуются в фоне, а не первым посетителем страницы.
+    if instance.image and not raw:
+        schedule_thumbnails(instance)
+
+
+@receiver(post_save, sender=Post)
+def expire_post_card(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        bump_post_versions([instance.pk])
+
+
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def expire_author_cards(sender, instance, created, raw=False,
+                        update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login: карточки не меняются.
+    if update_fields is not None and not CARD_USER_FIELDS & update_fields:
+        return
+    if not created and not raw:
+        bump_post_versions(
+            instance.posts.values_list('pk', flat=True).iterator()
+        )
+        group_slugs = instance.posts.exclude(group=None).values_list(
+            'group__slug', flat=True
+        ).distinct()
+        bump_generations(feed_scopes(instance, group_slugs))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def expire_group_cards(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk is not None:
+        bump_post_versions(
+            instance.posts.values_list('pk', flat=True).iterator()
+        )
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, raw=False, **kwargs):
+    # При переносе поста в другую группу устаревают обе страницы групп,
+    # при замене картинки освобождается ссылка на старый файл.
+    instance._previous_group_slug = None
+    instance._previous_image = None
+    if instance.pk is not None and not raw:
+        instance._previous_group_slug, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group__slug', 'image'
+            ).first() or (None, None)
+        )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def expire_post_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    group_slugs = {
+        getattr(instance, '_previous_group_slug', None),
+        instance.group.slug if instance.group_id else None,
+    }
+    bump_generations(
+        feed_scopes(instance.author, group_slugs) + [post_scope(instance.pk)]
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def expire_comment_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_generations([post_scope(instance.post_id)])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def expire_follow_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_generations([
+            profile_scope(instance.author.username),
+            follow_scope(instance.user_id),
+        ])
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, raw=False, **kwargs):
+    instance._previous_slug = None
+    if instance.pk is not None and not raw:
+        instance._previous_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def expire_group_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = [group_scope(instance.slug)]
+    previous_slug = getattr(instance, '_previous_slug', None)
+    if previous_slug and previous_slug != instance.slug:
+        # Ссылки на группу в общей ленте строятся по slug.
+        scopes += [group_scope(previous_slug), INDEX_SCOPE]
+    bump_generations(scopes)
+
+
+def release_image(name):
+    """Снимает ссылку на файл картинки; последняя ссылка удаляет файл."""
+    storage = Post._meta.get_field('image').storage
+    if not storage.is_hashed(name) or ImageBlob.bump(name, -1) > 0:
+        return
+    ImageBlob.objects.filter(name=name, refcount=0).delete()
+
+    def delete_file():
+        # Тот же файл могли загрузить снова, пока транзакция шла.
+        if not Post.objects.filter(image=name).exists():
+            storage.delete(name)
+
+    transaction.on_commit(delete_file)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    storage = Post._meta.get_field('image').storage
+    previous = getattr(instance, '_previous_image', None)
+    if instance.image.name == previous:
+        return
+    if storage.is_hashed(instance.image.name):
+        ImageBlob.bump(instance.image.name, 1)
+    if previous:
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    if instance.image:
+        release_image(instance.image.name)
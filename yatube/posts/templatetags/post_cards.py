@@ -0,0 +1,17 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..caching import render_post_cards
+from ..thumbnails import submit_missing
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Карточки постов из кэша: {% post_cards page_obj as cards %}."""
+    return [
+        (post, mark_safe(card)) for post, card in render_post_cards(
+            posts, prepare=lambda missing: submit_missing(missing, 'card')
+        )
+    ]
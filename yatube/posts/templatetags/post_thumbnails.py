@@ -0,0 +1,44 @@
+from django import template
+
+from ..thumbnails import (
+    FALLBACK_FORMAT, FORMATS, GEOMETRIES, SIZES, cached_variants,
+)
+
+register = template.Library()
+
+
+def srcset(thumbnails, image_format):
+    # Дескриптор — настоящая ширина файла: без полей миниатюра бывает
+    # уже запрошенной, сохраняя пропорции оригинала.
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w'
+        for (_, variant_format), thumbnail in sorted(thumbnails.items())
+        if variant_format == image_format
+    )
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post, name, css_class):
+    """Картинка поста с srcset: {% post_image post 'card' 'card-img' %}.
+
+    Пока фоновая задача не нарисовала все варианты, выводит заглушку
+    нужных пропорций. Задачи ставят сигнал сохранения поста, сборка
+    карточек лент (render_post_cards) и страница поста, а не шаблон.
+    """
+    geometry, options = GEOMETRIES[name]
+    width, height = (int(side) for side in geometry.split('x'))
+    context = {'post': post, 'css_class': css_class, 'sizes': SIZES}
+    thumbnails = cached_variants(post, name)
+    if thumbnails is None:
+        if not options.get('padding') and post.image_width:
+            # Без полей миниатюра сохраняет пропорции оригинала.
+            width, height = post.image_width, post.image_height
+        context['ratio'] = f'{width} / {height}'
+        return context
+    context['image'] = thumbnails[width, FALLBACK_FORMAT]
+    context['sources'] = [
+        (f'image/{image_format.lower()}', srcset(thumbnails, image_format))
+        for image_format in FORMATS if image_format != FALLBACK_FORMAT
+    ]
+    context['srcset'] = srcset(thumbnails, FALLBACK_FORMAT)
+    return context
@@ -0,0 +1,219 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..caching import version_key
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class PostApiTest(TestCase):
+    """JSON API лент и постов."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='slug', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.author, group=cls.group)
+            for i in range(13)
+        )
+        cls.post = Post.objects.latest('pk')
+        Comment.objects.create(post=cls.post, author=cls.reader, text='К')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_pages(self):
+        response = self.client.get(reverse('api:index'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        first = response.json()
+        self.assertEqual(len(first['results']), 10)
+        self.assertIsNone(first['previous'])
+        self.assertEqual(
+            first['results'][0]['author'],
+            {'username': 'author', 'full_name': 'Лев Толстой'},
+        )
+        self.assertEqual(
+            first['results'][0]['group'], {'slug': 'slug', 'title': 'Группа'}
+        )
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 3)
+        self.assertIsNone(second['next'])
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 13)
+
+    def test_queries_do_not_grow_with_page(self):
+        """Автор и группа приходят тем же запросом, что и посты."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('api:index'))
+        self.assertEqual(len(queries), 1)
+
+    def test_sparse_fields(self):
+        response = self.client.get(
+            reverse('api:index'), {'fields': 'id,text'}
+        )
+        post = response.json()['results'][0]
+        self.assertEqual(set(post), {'id', 'text'})
+        self.assertIn('fields=id%2Ctext', response.json()['next'])
+        response = self.client.get(reverse('api:index'), {'fields': 'pk'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag(self):
+        url = reverse('api:group_list', args=('slug',))
+        response = self.client.get(url)
+        self.assertEqual(response.json()['group']['description'], 'Описание')
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='Новый', author=self.author, group=self.group)
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_and_post(self):
+        self.client.force_login(self.reader)
+        data = self.client.get(
+            reverse('api:profile', args=('author',))
+        ).json()
+        self.assertEqual(data['author']['posts_count'], 13)
+        self.assertTrue(data['author']['following'])
+        data = self.client.get(
+            reverse('api:post_detail', args=(self.post.pk,))
+        ).json()
+        self.assertEqual(data['comments_count'], 1)
+        self.assertEqual(data['comments']['results'][0]['text'], 'К')
+
+    def test_hidden_comments_are_not_counted(self):
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Скрытый', active=False
+        )
+        data = self.client.get(
+            reverse('api:post_detail', args=(self.post.pk,))
+        ).json()
+        self.assertEqual(data['comments_count'], 1)
+        self.assertEqual(len(data['comments']['results']), 1)
+
+    def test_tampered_cursor_is_bad_request(self):
+        cursor = 'eyJub3QiOiAiYSBsaXN0In0'
+        for url, params in (
+            (reverse('api:index'), {'after': cursor}),
+            (reverse('api:index'), {'before': 'не курсор'}),
+            (reverse('api:group_list', args=('slug',)), {'after': cursor}),
+            (reverse('api:post_detail', args=(self.post.pk,)),
+             {'after': cursor}),
+        ):
+            with self.subTest(url=url, params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('detail', response.json())
+        # Ошибка не закэширована: годный запрос отдаёт страницу.
+        response = self.client.get(reverse('api:index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed(self):
+        response = self.client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 401)
+        self.client.force_login(self.reader)
+        data = self.client.get(reverse('api:follow_index')).json()
+        self.assertEqual(len(data['results']), 10)
+
+    def test_errors_are_json(self):
+        for url in (
+            reverse('api:group_list', args=('missing',)),
+            reverse('api:profile', args=('missing',)),
+            reverse('api:post_detail', args=(10 ** 6,)),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('detail', response.json())
+        response = self.client.post(reverse('api:index'))
+        self.assertEqual(response.status_code, 405)
+
+
+class PostBatchApiTest(TestCase):
+    """Пакетная выдача постов по id."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {i}', author=cls.author)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, ids, **params):
+        return self.client.get(
+            reverse('api:posts_batch'),
+            dict(params, ids=','.join(str(post_id) for post_id in ids)),
+        )
+
+    def test_requested_order_and_missing(self):
+        ids = [self.posts[3].pk, 10 ** 6, self.posts[0].pk, self.posts[3].pk]
+        data = self.fetch(ids, fields='id,text').json()
+        self.assertEqual(
+            data['results'],
+            [
+                {'id': self.posts[3].pk, 'text': 'Пост 3'},
+                {'id': self.posts[0].pk, 'text': 'Пост 0'},
+            ],
+        )
+        self.assertEqual(data['missing'], [10 ** 6])
+
+    def test_unknown_ids_get_no_cache_keys(self):
+        """Произвольные id не заводят версий и не сдвигают эпоху кэша."""
+        shared = caches['shared']
+        epoch = shared.get(cache.epoch_key)
+        self.fetch([10 ** 6, 10 ** 6 + 1])
+        self.assertEqual(shared.get(cache.epoch_key), epoch)
+        self.assertEqual(
+            cache.get_many([version_key(10 ** 6), version_key(10 ** 6 + 1)]),
+            {},
+        )
+
+    def test_constant_queries_and_warm_cache(self):
+        ids = [post.pk for post in self.posts]
+        with self.assertNumQueries(1):
+            self.fetch(ids)
+        with self.assertNumQueries(0):
+            data = self.fetch(ids).json()
+        self.assertEqual(len(data['results']), 5)
+
+    def test_cache_follows_changes(self):
+        post = Post.objects.get(pk=self.posts[0].pk)
+        self.fetch([post.pk])
+        post.text = 'Исправленный'
+        post.save()
+        Comment.objects.create(post=post, author=self.author, text='К')
+        result, = self.fetch([post.pk]).json()['results']
+        self.assertEqual(result['text'], 'Исправленный')
+        self.assertEqual(result['comments_count'], 1)
+        Post.objects.filter(pk=post.pk).delete()
+        self.assertEqual(self.fetch([post.pk]).json()['results'], [])
+
+    def test_bad_requests(self):
+        for params in (
+            {'ids': ''},
+            {'ids': '1,x'},
+            {'ids': ','.join(str(i) for i in range(1, 200))},
+            {'ids': '1', 'fields': 'secret'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    reverse('api:posts_batch'), params
+                )
+                self.assertEqual(response.status_code, 400)
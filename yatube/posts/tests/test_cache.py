@@ -1,6 +1,14 @@
+import time
+from unittest.mock import patch
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
 from django.test import Client, TestCase
-from posts.models import Post
+from django.urls import reverse
+
+from posts import caching
+from posts.models import Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -9,18 +17,217 @@ class PostCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        cls.author = User.objects.create()
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='slug')
 
     def setUp(self) -> None:
         super().setUp()
+        cache.clear()
         self.guest_client = Client()
 
     def test_cashe(self):
         """Пост сохраняется в кэше. """
-        Post.objects.create(text='test_note', author=self.author)
+        post = Post.objects.create(text='test_note', author=self.author)
         request1 = self.guest_client.get('/')
-        Post.objects.all().delete()
+        # update() не отправляет сигналов, поэтому кэш не сбрасывается.
+        Post.objects.filter(pk=post.pk).update(text='changed_note')
         request2 = self.guest_client.get('/')
         request1_content = str(request1.content)
         request2_content = str(request2.content)
         self.assertHTMLEqual(request1_content, request2_content)
+
+    def test_write_expires_cached_pages(self):
+        """Новый пост сразу виден на закэшированных страницах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        Post.objects.create(
+            text='Свежий пост', author=self.author, group=self.group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+        Post.objects.all().delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(
+                    self.guest_client.get(url), 'Свежий пост'
+                )
+
+    def test_follow_expires_follow_page(self):
+        """Подписка сразу обновляет ленту подписок."""
+        reader = User.objects.create(username='reader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        Post.objects.create(text='Пост автора', author=self.author)
+        follow_url = reverse('posts:follow_index')
+        self.assertNotContains(reader_client.get(follow_url), 'Пост автора')
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertContains(reader_client.get(follow_url), 'Пост автора')
+
+
+class StampedeProtectionTest(TestCase):
+    """Просроченную запись пересобирает один запрос, остальные
+    получают старую копию."""
+    def setUp(self):
+        cache.clear()
+        caching.reset_metrics()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return f'сборка {self.builds}'
+
+    def test_fresh_entry_is_not_rebuilt(self):
+        caching.store('key', 'свежее', 60)
+        self.assertEqual(caching.get_or_build('key', self.build, 60), 'свежее')
+        self.assertEqual(self.builds, 0)
+        self.assertEqual(caching.get_metrics()['hit'], 1)
+
+    def test_stale_entry_served_while_locked(self):
+        cache.set('key', ('старое', 0), 60)
+        self.assertTrue(caching.acquire('key'))
+        self.assertEqual(caching.get_or_build('key', self.build, 60), 'старое')
+        self.assertEqual(self.builds, 0)
+        self.assertEqual(caching.get_metrics()['stale'], 1)
+
+    def test_stale_entry_rebuilt_by_lock_holder(self):
+        cache.set('key', ('старое', 0), 60)
+        self.assertEqual(
+            caching.get_or_build('key', self.build, 60), 'сборка 1'
+        )
+        self.assertEqual(caching.get_or_build('key', self.build, 60),
+                         'сборка 1')
+        self.assertEqual(caching.get_metrics()['rebuild'], 1)
+        self.assertTrue(caching.acquire('key'), 'Блокировка не снята')
+
+    def test_stale_local_copy_rereads_shared(self):
+        """Запись, пересобранную другим воркером, не собирают заново,
+        даже если в памяти процесса осталась просроченная копия."""
+        cache.set('page:key', ('старое', 0), 60)
+        caches['shared'].set('page:key', ('чужая сборка', time.time() + 60))
+        self.assertEqual(
+            caching.get_or_build('page:key', self.build, 60), 'чужая сборка'
+        )
+        self.assertEqual(self.builds, 0)
+        self.assertEqual(caching.get_metrics()['hit'], 1)
+
+    def test_hits_are_not_written_to_cache(self):
+        """Попадания копятся в процессе, а не пишутся в кэш."""
+        caching.store('key', 'свежее', 60)
+        with patch.object(cache, 'incr') as incr:
+            for _ in range(3):
+                caching.get_or_build('key', self.build, 60)
+        incr.assert_not_called()
+        self.assertEqual(caching.get_metrics()['hit'], 3)
+
+    @patch.object(caching, 'WAIT_TIMEOUT', 0.1)
+    def test_missing_entry_waits_then_builds(self):
+        self.assertTrue(caching.acquire('key'))
+        self.assertEqual(
+            caching.get_or_build('key', self.build, 60), 'сборка 1'
+        )
+
+
+class ConditionalGetTest(TestCase):
+    """Неизменившиеся страницы отдаются как 304 без работы с базой."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='slug')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+        )
+
+    def test_unchanged_page_returns_304(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_post_page_returns_304(self):
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        etag = self.client.get(url)['ETag']
+        # Пост проверяется в базе, чтобы не заводить поколение чужого id.
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_page_etag_follows_csrf_cookie(self):
+        """Вошедшему пользователю страница с формой комментария отдаётся
+        как 304, только пока у него та же кука CSRF."""
+        url = reverse('posts:post_detail', args=(self.post.id,))
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertIn(settings.CSRF_COOKIE_NAME, self.client.cookies)
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'x' * 64
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_reads_do_not_move_epoch(self):
+        """Заведение поколений при чтении не сбрасывает кэш воркеров."""
+        shared = caches['shared']
+        epoch = shared.get(cache.epoch_key)
+        for url in self.urls:
+            self.client.get(url)
+        self.assertEqual(shared.get(cache.epoch_key), epoch)
+
+    def test_unknown_post_gets_no_generation(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=(10 ** 6,))
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(
+            cache.get(caching.generation_key(caching.post_scope(10 ** 6)))
+        )
+
+    def test_unknown_group_and_profile_get_no_generation(self):
+        urls = {
+            reverse('posts:group_list', args=('nope',)): 'group',
+            reverse('posts:group_rss', args=('nope',)): 'group',
+            reverse('api:group_list', args=('nope',)): 'group',
+            reverse('posts:profile', args=('ghost',)): 'profile',
+            reverse('posts:profile_atom', args=('ghost',)): 'profile',
+            reverse('api:profile', args=('ghost',)): 'profile',
+        }
+        scopes = {
+            'group': caching.group_scope('nope'),
+            'profile': caching.profile_scope('ghost'),
+        }
+        for url, kind in urls.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+                self.assertIsNone(
+                    cache.get(caching.generation_key(scopes[kind]))
+                )
+
+    def test_write_changes_etag(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        Comment.objects.create(post=self.post, author=self.author, text='К')
+        self.post.text = 'Новый текст'
+        self.post.save()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
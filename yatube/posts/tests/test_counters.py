@@ -0,0 +1,132 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import caching
+from ..models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    """Хранимые счётчики обновляются при записи."""
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        Post.objects.create(text='Пост', author=self.author)
+        self.assertEqual(self.stats(self.author).posts_count, 2)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+
+    def test_only_active_comments_are_counted(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Скрытый', active=False
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        comment.active = True
+        comment.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.active = False
+        comment.save()
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_follow_counters(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_delete_user_with_posts_and_follows(self):
+        """Каскадное удаление пользователя не пересоздаёт его счётчики."""
+        Post.objects.create(text='Пост', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        author_id = self.author.pk
+        self.author.delete()
+        connection.check_constraints()
+        self.assertFalse(UserStats.objects.filter(user_id=author_id).exists())
+        stats = self.stats(self.reader)
+        self.assertEqual(stats.followers_count, 0)
+        self.assertEqual(stats.following_count, 0)
+
+    def test_decrement_does_not_go_negative(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(followers_count=0, following_count=0)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_repair_counters_command(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(posts_count=100, followers_count=100)
+        Post.objects.update(comments_count=100)
+        call_command('repair_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        stats = self.stats(self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+    def test_repair_counters_expires_changed_profiles(self):
+        """Исправленный счётчик сразу виден на закэшированном профиле."""
+        cache.clear()
+        Post.objects.create(text='Пост', author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=100)
+        url = reverse('posts:profile', args=(self.author.username,))
+        self.assertContains(self.client.get(url), 'Всего постов: 100 ')
+        reader_generations = caching.get_generations(
+            [caching.profile_scope(self.reader.username)]
+        )
+        out = StringIO()
+        call_command('repair_counters', stdout=out)
+        self.assertIn('изменилось 1', out.getvalue())
+        self.assertContains(self.client.get(url), 'Всего постов: 1 ')
+        self.assertEqual(caching.get_generations(
+            [caching.profile_scope(self.reader.username)]
+        ), reader_generations)
+
+    def test_pages_do_not_aggregate(self):
+        """Профиль и пост не считают записи агрегатами."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        urls = (
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(post.id,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertFalse(any(
+                    'COUNT(' in query['sql']
+                    for query in queries.captured_queries
+                ))
@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def read_jsonl_gz(data):
+    return [json.loads(line) for line in gzip.decompress(data).splitlines()]
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class ExportContentTest(TestCase):
+    """Выгрузка командой export_content и действием админки."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(title='Группа', slug='slug')
+        cls.old = Post.objects.create(text='Старый', author=cls.author)
+        Post.objects.filter(pk=cls.old.pk).update(
+            pub_date=timezone.now() - timedelta(days=30)
+        )
+        cls.new = Post.objects.create(
+            text='Новый',
+            author=cls.author,
+            group=group,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+        Comment.objects.create(post=cls.new, author=cls.reader, text='К')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, *args):
+        call_command(
+            'export_content', self.directory, *args, stdout=StringIO()
+        )
+
+        def read(name):
+            with open(os.path.join(self.directory, name), 'rb') as source:
+                return read_jsonl_gz(source.read())
+        return read
+
+    def test_full_export(self):
+        read = self.export()
+        posts = read('posts.jsonl.gz')
+        self.assertEqual(
+            [post['text'] for post in posts], ['Старый', 'Новый']
+        )
+        self.assertEqual(posts[1]['group'], 'slug')
+        self.assertEqual(read('comments.jsonl.gz')[0]['post'], self.new.pk)
+        self.assertEqual(
+            read('follows.jsonl.gz'), [{'user': 'reader', 'author': 'author'}]
+        )
+        media, = read('media.jsonl.gz')
+        self.assertEqual(media['name'], self.new.image.name)
+        self.assertEqual(
+            media['sha256'], hashlib.sha256(SMALL_GIF).hexdigest()
+        )
+        with open(os.path.join(self.directory, 'export.json')) as source:
+            summary = json.load(source)
+        self.assertEqual(summary['counts']['posts'], 2)
+
+    def test_since(self):
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        read = self.export('--since', since)
+        self.assertEqual(
+            [post['text'] for post in read('posts.jsonl.gz')], ['Новый']
+        )
+        self.assertEqual(len(read('follows.jsonl.gz')), 1)
+
+    def test_round_trip_through_import(self):
+        """Выгрузка читается import_content без потерь."""
+        read = self.export()
+        exported = read('posts.jsonl.gz')
+        Post.objects.all().delete()
+        call_command(
+            'import_content', 'posts',
+            os.path.join(self.directory, 'posts.jsonl.gz'),
+            stdout=StringIO(),
+        )
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'image'
+            )),
+            [
+                (post['id'], post['text'],
+                 datetime.fromisoformat(post['pub_date']),
+                 post['image'])
+                for post in exported
+            ],
+        )
+
+    def test_admin_action(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {'action': 'export_posts', '_selected_action': [self.new.pk]},
+        )
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        posts = read_jsonl_gz(b''.join(response.streaming_content))
+        self.assertEqual([post['id'] for post in posts], [self.new.pk])
@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from ..feeds import FEED_ITEMS
+from ..models import Group, Post
+
+User = get_user_model()
+
+
+class PostFeedsTest(TestCase):
+    """RSS и Atom ленты сайта, групп и авторов."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='slug', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.author, group=cls.group)
+            for i in range(FEED_ITEMS + 5)
+        )
+        Post.objects.create(text='Вне группы', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds(self):
+        urls = {
+            reverse('posts:index_rss'): 'application/rss+xml',
+            reverse('posts:index_atom'): 'application/atom+xml',
+            reverse('posts:group_rss', args=('slug',)): 'application/rss+xml',
+            reverse('posts:group_atom', args=('slug',)):
+                'application/atom+xml',
+            reverse('posts:profile_rss', args=('author',)):
+                'application/rss+xml',
+            reverse('posts:profile_atom', args=('author',)):
+                'application/atom+xml',
+        }
+        for url, content_type in urls.items():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(response['Content-Type'].startswith(
+                    content_type
+                ))
+                self.assertEqual(
+                    response.content.count(b'<item>')
+                    + response.content.count(b'<entry>'),
+                    FEED_ITEMS,
+                )
+
+    def test_group_feed_has_group_posts_only(self):
+        response = self.client.get(reverse('posts:group_rss', args=('slug',)))
+        self.assertContains(response, 'Описание')
+        self.assertNotContains(response, 'Вне группы')
+        response = self.client.get(reverse('posts:index_rss'))
+        self.assertContains(response, 'Вне группы')
+
+    def test_conditional_get_without_queries(self):
+        """Повторный опрос без новых постов обходится без базы."""
+        url = reverse('posts:group_atom', args=('slug',))
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_cache_is_per_host(self):
+        """Абсолютные ссылки ленты не достаются другому хосту из кэша."""
+        url = reverse('posts:index_rss')
+        first = self.client.get(url, HTTP_HOST='localhost')
+        second = self.client.get(url, HTTP_HOST='127.0.0.1')
+        self.assertContains(first, 'http://localhost/')
+        self.assertContains(second, 'http://127.0.0.1/')
+        self.assertNotContains(second, 'http://localhost/')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_new_post_invalidates_feeds(self):
+        url = reverse('posts:profile_rss', args=('author',))
+        etag = self.client.get(url)['ETag']
+        Post.objects.create(text='Свежий', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Свежий')
+
+    def test_unknown_feed_objects(self):
+        for url in (
+            reverse('posts:group_rss', args=('missing',)),
+            reverse('posts:profile_atom', args=('missing',)),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_pages_link_feeds(self):
+        response = self.client.get(
+            reverse('posts:group_list', args=('slug',))
+        )
+        self.assertContains(
+            response, reverse('posts:group_rss', args=('slug',))
+        )
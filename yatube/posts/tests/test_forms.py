@@ -1,13 +1,23 @@
+import shutil
+import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from ..forms import PostForm
+from ..images import MAX_SIDE
 from ..models import Group, Post, Comment
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
 
 class PostFormTests(TestCase):
     @classmethod
@@ -124,3 +134,53 @@ class CommentFormTests(TestCase):
         last_object = Comment.objects.order_by('-id').first()
         self.assertEqual(form_data['text'], last_object.text)
         self.assertEqual(self.comment.post.id, last_object.post.id)
+
+
+def image_upload(name, size, image_format):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, image_format)
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), content_type=f'image/{image_format.lower()}'
+    )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostFormImageTests(TestCase):
+    """Загрузки проверяются по заголовку, большие оригиналы уменьшаются."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def form(self, image):
+        return PostForm(data={'text': 'Текст поста'}, files={'image': image})
+
+    def test_large_original_is_downscaled(self):
+        form = self.form(image_upload('big.jpg', (3000, 1500), 'JPEG'))
+        self.assertTrue(form.is_valid(), form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (MAX_SIDE, MAX_SIDE // 2))
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_small_original_is_kept(self):
+        upload = image_upload('small.png', (300, 200), 'PNG')
+        form = self.form(upload)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIs(form.cleaned_data['image'], upload)
+
+    def test_unsupported_format_is_rejected(self):
+        form = self.form(image_upload('image.bmp', (10, 10), 'BMP'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def test_created_post_stores_downscaled_image(self):
+        author = User.objects.create_user(username='author')
+        client = Client()
+        client.force_login(author)
+        client.post(reverse('posts:create'), data={
+            'text': 'Текст поста',
+            'image': image_upload('big.jpg', (1000, 4000), 'JPEG'),
+        })
+        post = Post.objects.get(author=author)
+        self.assertEqual(post.image_height, MAX_SIDE)
+        self.assertEqual(post.image_width, MAX_SIDE // 4)
@@ -1,10 +1,12 @@
 import shutil
 import tempfile
+from io import StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
@@ -86,3 +88,57 @@ class PostImageExistTest(TestCase):
                 test_object = response.context['page_obj'][0]
                 post_image = test_object.image
                 self.assertEqual(post_image, self.post.image.name)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageMetadataTest(TestCase):
+    """Сведения о картинке сохраняются в посте при загрузке."""
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            text='Текст поста',
+            author=self.user,
+            image=SimpleUploadedFile(
+                'small.gif', self.small_gif, content_type='image/gif'
+            ),
+        )
+
+    def test_metadata_is_captured_on_upload(self):
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.image_format, 'GIF')
+        self.assertEqual(post.image_size, len(self.small_gif))
+        self.assertRegex(post.image_color, r'^#[0-9a-f]{6}$')
+
+    def test_edit_without_upload_keeps_metadata(self):
+        self.post.text = 'Новый текст'
+        self.post.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.image_width, 2)
+
+    def test_removed_image_clears_metadata(self):
+        self.post.image = None
+        self.post.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_color, '')
+
+    def test_command_fills_old_posts(self):
+        Post.objects.update(image_width=None, image_height=None)
+        call_command('fill_image_metadata', stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
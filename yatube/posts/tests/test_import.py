@@ -0,0 +1,176 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Comment, Follow, Group, Post, Timeline, UserStats
+from ..search import search_posts
+
+User = get_user_model()
+
+
+class ImportContentTest(TestCase):
+    """Потоковая загрузка командой import_content."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='slug')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, *args, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            'import_content', *args, stdout=stdout, stderr=stderr, **options
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_posts_jsonl(self):
+        """Посты сохраняют даты, попадают в ленты, счётчики и поиск."""
+        path = self.write('posts.jsonl', [
+            json.dumps({
+                'id': 100 + i,
+                'author': 'author',
+                'group': 'slug',
+                'text': f'Импортированный пост {i}',
+                'pub_date': f'2020-01-0{i + 1}T12:00:00',
+            })
+            for i in range(5)
+        ])
+        self.client.get(reverse('posts:index'))
+        self.run_import('posts', path, batch_size=2)
+        posts = Post.objects.filter(author=self.author)
+        self.assertEqual(posts.count(), 5)
+        self.assertEqual(posts.first().pub_date.year, 2020)
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), 5
+        )
+        self.assertEqual(UserStats.for_user(self.author).posts_count, 5)
+        found, _ = search_posts('импортированный', 10)
+        self.assertEqual(len(found), 5)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Импортированный пост 4')
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_bad_records_are_rejected(self):
+        path = self.write('posts.jsonl', [
+            json.dumps({'author': 'author', 'text': 'Годный'}),
+            json.dumps({'author': 'nobody', 'text': 'Без автора'}),
+            json.dumps({'author': 'author', 'group': 'none', 'text': 'Т'}),
+            '{не json',
+        ])
+        _, errors = self.run_import('posts', path)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertIn('Запись 2', errors)
+        self.assertIn('Запись 4', errors)
+
+    def test_create_missing(self):
+        path = self.write('posts.jsonl', [
+            json.dumps({'author': 'new', 'group': 'fresh', 'text': 'Т'}),
+        ])
+        self.run_import('posts', path, create_missing=True)
+        post = Post.objects.get()
+        self.assertEqual(
+            (post.author.username, post.group.slug), ('new', 'fresh')
+        )
+
+    def test_comments_and_follows_csv(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+        comments = self.write('comments.csv', [
+            'post,author,text,active',
+            f'{post.pk},reader,Первый,1',
+            f'{post.pk},reader,Скрытый,0',
+            '999999,reader,К несуществующему,1',
+        ])
+        follows = self.write('follows.csv', [
+            'user,author',
+            'author,reader',
+            'reader,author',
+            'reader,reader',
+        ])
+        self.run_import('comments', comments)
+        self.run_import('follows', follows)
+        self.assertEqual(post.comments.filter(active=True).count(), 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Follow.objects.count(), 2)
+        self.assertEqual(UserStats.for_user(self.reader).followers_count, 1)
+
+    def test_counts_only_inserted_records(self):
+        """Повторная загрузка ничего не вставляет и так и сообщает."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        path = self.write('comments.jsonl', [
+            json.dumps({
+                'id': 300 + i, 'post': post.pk, 'author': 'reader',
+                'text': f'№{i}', 'created': '2019-05-01T10:00:00',
+            })
+            for i in range(3)
+        ])
+        output, _ = self.run_import('comments', path)
+        self.assertIn('загружено 3', output)
+        self.assertEqual(
+            set(Comment.objects.values_list('created__year', flat=True)),
+            {2019},
+        )
+        output, _ = self.run_import('comments', path, restart=True)
+        self.assertIn('загружено 0', output)
+        self.assertEqual(Comment.objects.count(), 3)
+        # Даты из файла не отключают auto_now_add для остального кода.
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Новый'
+        )
+        self.assertEqual(comment.created.year, timezone.now().year)
+
+    def test_resume_from_checkpoint(self):
+        """После обрыва загрузка продолжается с сохранённой пачки."""
+        path = self.write('posts.jsonl', [
+            json.dumps({'id': 200 + i, 'author': 'author', 'text': f'№{i}'})
+            for i in range(6)
+        ])
+        # Первые четыре записи будто бы уже загружены прошлым запуском.
+        Post.objects.bulk_create(
+            Post(id=200 + i, author=self.author, text=f'№{i}')
+            for i in range(4)
+        )
+        with open(f'{path}.checkpoint', 'w') as target:
+            json.dump({
+                'source': path, 'model': 'posts', 'position': 4,
+                'imported': 4, 'rejected': 0,
+            }, target)
+        output, _ = self.run_import('posts', path, batch_size=4)
+        self.assertIn('Продолжаем после записи 4', output)
+        self.assertIn('загружено 6', output)
+        self.assertEqual(Post.objects.count(), 6)
+        # Ленты пересобраны и для постов из прошлого запуска.
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), 6
+        )
+
+    def test_checkpoint_of_other_import(self):
+        path = self.write('posts.jsonl', ['{}'])
+        with open(f'{path}.checkpoint', 'w') as target:
+            json.dump(
+                {'source': path, 'model': 'follows', 'position': 1}, target
+            )
+        with self.assertRaisesMessage(CommandError, '--restart'):
+            self.run_import('posts', path)
+        self.run_import('posts', path, restart=True)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from ..caching import get_post_versions
+from ..models import Post
+from ..thumbnails import GEOMETRIES, cached_variants, pregenerate
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CollectMediaGarbageTest(TestCase):
+    """Сборка мусора удаляет только файлы, на которые нет ссылок."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.storage = Post._meta.get_field('image').storage
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            text='Текст поста',
+            author=self.author,
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        pregenerate(ImageFile(self.post.image))
+        self.orphan = self.storage._save(
+            'posts/orphan.gif', ContentFile(SMALL_GIF)
+        )
+        self.stray = default.storage._save(
+            'cache/00/00/stray.jpg', ContentFile(b'jpeg')
+        )
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def collect(self, *args):
+        output = StringIO()
+        call_command(
+            'collect_media_garbage', '--min-age=0', *args, stdout=output
+        )
+        return output.getvalue()
+
+    def test_dry_run_keeps_files(self):
+        output = self.collect('--dry-run')
+        self.assertIn(self.orphan, output)
+        self.assertIn(self.stray, output)
+        self.assertTrue(self.storage.exists(self.orphan))
+        self.assertTrue(default.storage.exists(self.stray))
+
+    def test_orphans_are_removed(self):
+        self.collect()
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertFalse(default.storage.exists(self.stray))
+        self.assertTrue(self.storage.exists(self.post.image.name))
+        for name in GEOMETRIES:
+            thumbnails = cached_variants(self.post, name)
+            for thumbnail in thumbnails.values():
+                self.assertTrue(thumbnail.exists())
+
+    def test_thumbnails_of_deleted_posts_are_removed(self):
+        thumbnails = cached_variants(self.post, 'card')
+        Post.objects.filter(pk=self.post.pk).delete()
+        self.collect()
+        for thumbnail in thumbnails.values():
+            self.assertFalse(thumbnail.exists())
+
+    def test_budget_evicts_thumbnails(self):
+        version = get_post_versions([self.post.pk])
+        thumbnails = cached_variants(self.post, 'card')
+        self.collect('--thumbnail-budget=0')
+        for thumbnail in thumbnails.values():
+            self.assertFalse(os.path.exists(
+                default.storage.path(thumbnail.name)
+            ))
+        self.assertIsNone(cached_variants(self.post, 'card'))
+        self.assertNotEqual(get_post_versions([self.post.pk]), version)
+        self.assertTrue(self.storage.exists(self.post.image.name))
+        # Лента с карточкой поста ставит задачу на новые миниатюры.
+        self.client.get(reverse('posts:index'))
+        self.assertIsNotNone(cached_variants(self.post, 'card'))
@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..caching import get_post_versions, render_post_cards
+from ..models import Group, Post
+
+User = get_user_model()
+
+
+class PostCardCacheTest(TestCase):
+    """Карточки постов кэшируются по версии поста."""
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        self.group = Group.objects.create(title='Группа', slug='slug')
+        self.post = Post.objects.create(
+            text='Текст поста', author=self.author, group=self.group
+        )
+
+    def card(self):
+        post = Post.objects.select_related('author').get(pk=self.post.pk)
+        return render_post_cards([post])[0][1]
+
+    def test_card_is_served_from_cache(self):
+        self.card()
+        with self.assertNumQueries(1):
+            self.card()
+        with self.assertTemplateNotUsed('includes/post.html'):
+            self.card()
+
+    def test_post_edit_bumps_version(self):
+        self.assertIn('Текст поста', self.card())
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertIn('Новый текст', self.card())
+
+    def test_author_rename_bumps_version(self):
+        self.assertIn('Лев Толстой', self.card())
+        self.author.first_name = 'Алексей'
+        self.author.save()
+        self.assertIn('Алексей Толстой', self.card())
+
+    def test_login_keeps_version(self):
+        version = get_post_versions([self.post.pk])
+        self.client.force_login(self.author)
+        self.assertEqual(get_post_versions([self.post.pk]), version)
+
+    def test_group_change_bumps_version(self):
+        version = get_post_versions([self.post.pk])
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertNotEqual(get_post_versions([self.post.pk]), version)
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from .utils import QueryBudgetMixin
+
+User = get_user_model()
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Число запросов страницы не зависит от числа постов на ней."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        for i in range(10):
+            author = User.objects.create_user(username=f'author{i}')
+            group = Group.objects.create(title=f'Группа {i}', slug=f'g{i}')
+            Follow.objects.create(user=cls.reader, author=author)
+            cls.post = Post.objects.create(
+                text=f'Пост #{i}', author=author, group=group
+            )
+            Comment.objects.create(
+                post=cls.post, author=author, text=f'Комментарий {i}'
+            )
+        cls.author = author
+        cls.group = group
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_guest_pages_budget(self):
+        budgets = {
+            reverse('posts:index'): 1,
+            reverse('posts:group_list', args=(self.group.slug,)): 2,
+            reverse('posts:profile', args=(self.author.username,)): 2,
+            reverse('posts:post_detail', args=(self.post.id,)): 3,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                self.assertQueryBudget(url, budget)
+
+    def test_authorized_pages_budget(self):
+        # Сессия и пользователь добавляют два запроса к каждой странице.
+        budgets = {
+            reverse('posts:index'): 3,
+            reverse('posts:group_list', args=(self.group.slug,)): 4,
+            reverse('posts:profile', args=(self.author.username,)): 5,
+            reverse('posts:post_detail', args=(self.post.id,)): 5,
+            reverse('posts:follow_index'): 3,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url):
+                self.assertQueryBudget(url, budget, client=self.reader_client)
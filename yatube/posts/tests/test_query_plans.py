@@ -0,0 +1,80 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+FEED_TABLES = re.compile(r'FROM "posts_\w+"')
+BAD_PLANS = (
+    re.compile(r'^SCAN (TABLE )?posts_\w+$'),
+    re.compile(r'TEMP B-TREE'),
+)
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент и поста идут по индексам, без полного прохода
+    таблицы и без сортировки во временном B-дереве."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='slug')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                text=f'Пост #{i}', author=cls.author, group=cls.group
+            )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def captured_feed_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(url)
+            page_obj = (response.context or {}).get('page_obj')
+            if page_obj is not None and page_obj.paginator.next_cursor:
+                self.reader_client.get(
+                    url, {'after': page_obj.paginator.next_cursor}
+                )
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+            and FEED_TABLES.search(query['sql'])
+        ]
+
+    def test_views_use_indexes(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.id,)),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            for sql in self.captured_feed_queries(url):
+                plan = self.explain(sql)
+                with self.subTest(url=url, sql=sql):
+                    for detail in plan:
+                        for bad_plan in BAD_PLANS:
+                            self.assertIsNone(
+                                bad_plan.search(detail),
+                                f'{url}: {detail}',
+                            )
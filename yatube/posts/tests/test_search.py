@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Group, Post
+from ..search import TABLE, install, search_posts
+
+User = get_user_model()
+
+
+class PostSearchTest(TestCase):
+    """Поиск по индексу FTS5, который следует за записью постов."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(title='Группа', slug='slug')
+        cls.rare = Post.objects.create(
+            text='Про котов и немного про собак', author=cls.author
+        )
+        cls.often = Post.objects.create(
+            text='Кот, коты, котов, котики — всё про котов',
+            author=cls.other,
+            group=cls.group,
+        )
+        Post.objects.create(text='Совсем о другом', author=cls.author)
+
+    def search(self, query, **kwargs):
+        posts, _ = search_posts(query, 10, **kwargs)
+        return posts
+
+    def test_more_relevant_posts_come_first(self):
+        self.assertEqual(
+            self.search('котов'), [self.often, self.rare]
+        )
+
+    def test_words_are_prefixes(self):
+        self.assertIn(self.often, self.search('котик'))
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.get(pk=self.rare.pk)
+        post.text = 'Теперь про попугаев'
+        post.save()
+        self.assertEqual(self.search('попуга'), [post])
+        self.assertNotIn(post, self.search('собак'))
+        post.delete()
+        self.assertEqual(self.search('попуга'), [])
+
+    def test_filters_by_group_and_author(self):
+        self.assertEqual(
+            self.search('котов', group_id=self.group.pk), [self.often]
+        )
+        self.assertEqual(
+            self.search('котов', author_id=self.author.pk), [self.rare]
+        )
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        Post.objects.create(
+            text='<script>alert(1)</script> хомяк', author=self.author
+        )
+        post, = self.search('хомяк')
+        self.assertIn('<mark>хомяк</mark>', post.snippet)
+        self.assertNotIn('<script>', post.snippet)
+
+    def test_operators_are_not_interpreted(self):
+        self.assertEqual(self.search('"котов'), self.search('котов'))
+        self.assertEqual(self.search('NOT OR *'), [])
+
+    def test_cursor_pagination(self):
+        first, cursor = search_posts('котов', 1)
+        self.assertEqual(first, [self.often])
+        second, cursor = search_posts('котов', 1, after=cursor)
+        self.assertEqual(second, [self.rare])
+        self.assertIsNone(cursor)
+
+    def test_triggers_survive_table_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {TABLE}_insert')
+        install()
+        post = Post.objects.create(text='Жираф', author=self.author)
+        self.assertEqual(self.search('жираф'), [post])
+
+    def test_search_page(self):
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'котов', 'group': 'slug'}
+        )
+        self.assertEqual(list(response.context['posts']), [self.often])
+        self.assertContains(response, '<mark>')
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'собак'}
+            )
+        self.assertTrue(any(
+            f'{TABLE} MATCH' in query['sql'] for query in queries
+        ))
+        self.assertEqual(list(response.context['cl'].result_list), [self.rare])
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ..models import ImageBlob, Post
+from ..thumbnails import cached_variants
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def upload(name='small.gif'):
+    return SimpleUploadedFile(name, SMALL_GIF, content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    """Картинки хранятся по хэшу содержимого, дубликаты — одним файлом."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+
+    def test_file_is_named_by_content_hash(self):
+        post = Post.objects.create(
+            text='Текст', author=self.author, image=upload()
+        )
+        self.assertRegex(
+            post.image.name,
+            r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.gif$',
+        )
+        digest = os.path.basename(post.image.name)
+        self.assertTrue(post.image.name.startswith(
+            f'posts/{digest[:2]}/{digest[2:4]}/'
+        ))
+
+    def test_duplicates_share_one_file(self):
+        first = Post.objects.create(
+            text='Первый', author=self.author, image=upload('a.gif')
+        )
+        second = Post.objects.create(
+            text='Второй', author=self.author, image=upload('b.gif')
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        blob = ImageBlob.objects.get(name=first.image.name)
+        self.assertEqual(blob.refcount, 2)
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+
+    def test_replaced_image_is_released(self):
+        post = Post.objects.create(
+            text='Текст', author=self.author, image=upload()
+        )
+        old_name = post.image.name
+        post.image = SimpleUploadedFile(
+            'other.gif', SMALL_GIF + b'\x00', content_type='image/gif'
+        )
+        post.save()
+        self.assertFalse(ImageBlob.objects.filter(name=old_name).exists())
+        blob = ImageBlob.objects.get(name=post.image.name)
+        self.assertEqual(blob.refcount, 1)
+
+    def test_migrate_media_moves_flat_files(self):
+        storage = Post._meta.get_field('image').storage
+        name = 'posts/legacy.gif'
+        storage._save(name, ContentFile(SMALL_GIF))
+        post = Post.objects.create(text='Текст', author=self.author)
+        Post.objects.filter(pk=post.pk).update(image=name)
+        call_command('migrate_media', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(storage.is_hashed(post.image.name))
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertFalse(storage.exists(name))
+        blob = ImageBlob.objects.get(name=post.image.name)
+        self.assertEqual(blob.refcount, 1)
+        # Миниатюры sorl под новым именем нарисованы сразу.
+        self.assertIsNotNone(cached_variants(post, 'card'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class ImageFileDeletionTest(TransactionTestCase):
+    """Файл удаляется после фиксации, когда на него не осталось ссылок."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+
+    def test_last_reference_deletes_file(self):
+        first = Post.objects.create(
+            text='Первый', author=self.author, image=upload()
+        )
+        second = Post.objects.create(
+            text='Второй', author=self.author, image=upload()
+        )
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
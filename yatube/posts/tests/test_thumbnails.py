@@ -0,0 +1,178 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from ..caching import get_post_versions
+from ..models import Post
+from ..thumbnails import (
+    FALLBACK_FORMAT, GEOMETRIES, WIDTHS, cached_variants, pregenerate,
+    prefetch_variants, submit,
+)
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class ThumbnailPregenerationTest(TestCase):
+    """Миниатюры рисуются задачей, а шаблоны до этого показывают заглушку."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            text='Текст поста',
+            author=self.author,
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'
+            ),
+        )
+
+    def test_pregenerate_renders_every_geometry(self):
+        for name in GEOMETRIES:
+            self.assertIsNone(cached_variants(self.post, name))
+        pregenerate(ImageFile(self.post.image))
+        for name in GEOMETRIES:
+            with self.subTest(name=name):
+                thumbnails = cached_variants(self.post, name)
+                self.assertIsNotNone(thumbnails)
+                self.assertEqual(
+                    sorted({width for width, _ in thumbnails}), list(WIDTHS)
+                )
+
+    def test_card_variants_keep_geometry(self):
+        pregenerate(ImageFile(self.post.image))
+        thumbnails = cached_variants(self.post, 'card')
+        for (width, image_format), thumbnail in thumbnails.items():
+            with self.subTest(width=width, image_format=image_format):
+                self.assertEqual(thumbnail.width, width)
+                self.assertEqual(thumbnail.height, round(339 * width / 960))
+
+    def test_pregenerate_expires_card(self):
+        version = get_post_versions([self.post.pk])
+        submit(self.post)
+        self.assertNotEqual(get_post_versions([self.post.pk]), version)
+        version = get_post_versions([self.post.pk])
+        submit(self.post)
+        self.assertEqual(get_post_versions([self.post.pk]), version)
+
+    def test_feed_enqueues_missing_cards(self):
+        """Лента ставит задачи для карточек без миниатюр: сигнал мог
+        не сработать (импорт, старые картинки, сбой задачи)."""
+        self.assertIsNone(cached_variants(self.post, 'card'))
+        self.client.get(reverse('posts:index'))
+        self.assertIsNotNone(cached_variants(self.post, 'card'))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>')
+
+    def test_pregenerate_thumbnails_command(self):
+        stdout = StringIO()
+        call_command('pregenerate_thumbnails', stdout=stdout)
+        self.assertIn('нарисованы для постов: 1', stdout.getvalue())
+        for name in GEOMETRIES:
+            self.assertIsNotNone(cached_variants(self.post, name))
+        stdout = StringIO()
+        call_command('pregenerate_thumbnails', self.post.pk, stdout=stdout)
+        self.assertIn('нарисованы для постов: 0', stdout.getvalue())
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        response = self.client.get(url)
+        self.assertNotContains(response, '<img class="card-img-top"')
+        # Без полей заглушка повторяет пропорции оригинала 2x1.
+        self.assertContains(response, 'aspect-ratio: 2 / 1')
+        # Страница поста поставила задачу; теперь миниатюры готовы.
+        response = self.client.get(url)
+        thumbnails = cached_variants(self.post, 'detail')
+        self.assertContains(response, thumbnails[960, FALLBACK_FORMAT].url)
+        self.assertContains(response, 'srcset=')
+        # Оригинал 2x1 вписан в 960x339 без полей: ширина 678, а не 960.
+        detail = thumbnails[960, FALLBACK_FORMAT]
+        self.assertEqual(detail.width, 678)
+        self.assertContains(response, f'{detail.url} 678w')
+        self.assertContains(response, 'loading="lazy"')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class ThumbnailKVStoreTest(TestCase):
+    """Сведения о миниатюрах страницы читаются одним обращением."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {index}',
+                author=self.author,
+                image=SimpleUploadedFile(
+                    f'{index}.gif', SMALL_GIF + bytes([index]),
+                    content_type='image/gif',
+                ),
+            )
+            for index in range(3)
+        ]
+        for post in self.posts:
+            pregenerate(ImageFile(post.image))
+
+    def test_cold_cache_costs_one_query(self):
+        cache.clear()
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            prefetch_variants(posts, 'card')
+        for post in posts:
+            self.assertIsNotNone(cached_variants(post, 'card'))
+
+    def test_warm_cache_costs_no_queries(self):
+        cache.clear()
+        call_command('warm_thumbnails', stdout=StringIO())
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(0):
+            prefetch_variants(posts, 'card')
+            for post in posts:
+                self.assertIsNotNone(cached_variants(post, 'card'))
+
+    def test_feed_renders_cards_with_one_lookup(self):
+        cache.clear()
+        call_command('warm_thumbnails', stdout=StringIO())
+        get_many = default.kvstore.get_many
+        calls = []
+
+        def counting(image_files):
+            calls.append(1)
+            return get_many(image_files)
+
+        default.kvstore.get_many = counting
+        try:
+            response = self.client.get(reverse('posts:index'))
+        finally:
+            del default.kvstore.get_many
+        self.assertEqual(len(calls), 1)
+        self.assertContains(response, '<picture>', count=3)
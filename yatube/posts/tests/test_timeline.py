@@ -0,0 +1,74 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Follow, Post, Timeline
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    """Лента подписок заполняется при записи, а не при чтении."""
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            Timeline.objects.filter(user=self.reader, post=post).exists()
+        )
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        Post.objects.create(text='Старый пост', author=self.author)
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,))
+        )
+        self.assertEqual(Timeline.objects.filter(user=self.reader).count(), 1)
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,))
+        )
+        self.assertFalse(Timeline.objects.filter(user=self.reader).exists())
+
+    def test_follow_index_reads_timeline(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Пост #{i}', author=self.author)
+            for i in range(12)
+        ]
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), posts[::-1][:10])
+        response = self.reader_client.get(
+            reverse('posts:follow_index'),
+            {'after': page_obj.paginator.next_cursor},
+        )
+        self.assertEqual(list(response.context['page_obj']), posts[1::-1])
+
+    def test_rebuild_timelines_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Пост', author=self.author)
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            list(Timeline.objects.values_list('user', 'post')),
+            [(self.reader.id, post.id)],
+        )
+
+    def test_rebuild_timelines_expires_follow_page(self):
+        """Пересобранная лента сразу видна, а не после TTL кэша."""
+        cache.clear()
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Потерянный пост', author=self.author)
+        Timeline.objects.all().delete()
+        url = reverse('posts:follow_index')
+        self.assertNotContains(self.reader_client.get(url), 'Потерянный пост')
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertContains(self.reader_client.get(url), 'Потерянный пост')
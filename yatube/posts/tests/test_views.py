@@ -1,10 +1,16 @@
+import base64
+import json
+
 from django import forms
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.cache import cache
 
-from ..models import Group, Post, Follow
+from ..models import Comment, Group, Post, Follow
+from ..views import COMMENTS_PER_PAGE
 
 User = get_user_model()
 
@@ -197,3 +203,151 @@ class PaginatorViewsTest(TestCase):
                         ),
                     posts_on_second_page
                 )
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.group = Group.objects.create(slug='slug')
+        Post.objects.bulk_create(
+            Post(text=f'Пост #{i}', author=cls.user, group=cls.group)
+            for i in range(13)
+        )
+        cache.clear()
+
+    def test_cursor_pages_do_not_count(self):
+        """Лента листается курсором без OFFSET."""
+        url_pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for url in url_pages:
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.client.get(url)
+                first = response.context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertTrue(first.has_next())
+                self.assertFalse(first.has_previous())
+                cursor = first.paginator.next_cursor
+                response = self.client.get(url, {'after': cursor})
+                second = response.context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                self.assertTrue(second.has_previous())
+                ids = [post.id for post in list(first) + list(second)]
+                self.assertEqual(len(set(ids)), 13)
+                response = self.client.get(
+                    url, {'before': second.paginator.previous_cursor}
+                )
+                self.assertEqual(
+                    [post.id for post in response.context['page_obj']],
+                    [post.id for post in first],
+                )
+                self.assertFalse(
+                    any('OFFSET' in query['sql'] for query in
+                        self._queries_for(url, {'after': cursor}))
+                )
+
+    def test_index_does_not_count(self):
+        """Главная страница не считает все записи таблицы."""
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in
+                self._queries_for(reverse('posts:index'), {}))
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор отдаёт первую страницу."""
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            {'after': 'мусор'},
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_tampered_cursor_returns_first_page(self):
+        """Курсор с чужими значениями ключей не роняет страницу."""
+        for values in (['garbage', 1], ['2020-01-01T00:00:00', 'abc']):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(values).encode()
+            ).decode()
+            with self.subTest(values=values):
+                response = self.client.get(
+                    reverse('posts:index'), {'after': cursor}
+                )
+                self.assertEqual(len(response.context['page_obj']), 10)
+
+    def _queries_for(self, url, data):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, data)
+        return queries.captured_queries
+
+
+class CommentPagesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='auth')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+        readers = [
+            User.objects.create(username=f'reader{i}') for i in range(3)
+        ]
+        for i in range(COMMENTS_PER_PAGE + 5):
+            Comment.objects.create(
+                post=cls.post, author=readers[i % 3], text=f'Комментарий {i}'
+            )
+        cls.hidden = Comment.objects.create(
+            post=cls.post, author=cls.user, text='Скрытый', active=False
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_shows_first_page_of_active_comments(self):
+        """На странице поста только первая страница активных комментариев."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.id,))
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertNotIn(self.hidden, comments)
+        self.assertEqual(
+            comments[0].text, f'Комментарий {COMMENTS_PER_PAGE + 4}'
+        )
+        self.assertContains(response, 'data-comments-more')
+
+    def test_load_more_returns_next_fragment(self):
+        """«Показать ещё» отдаёт остаток фрагментом, без повторов."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.id,))
+        )
+        first = response.context['comments']
+        url = reverse('posts:post_comments', args=(self.post.id,))
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                url, {'after': first.paginator.next_cursor}
+            )
+        second = response.context['comments']
+        self.assertEqual(len(second), 5)
+        self.assertFalse(set(first) & set(second))
+        self.assertNotContains(response, 'data-comments-more')
+        self.assertNotContains(response, '<html')
+
+    def test_comment_authors_in_one_query(self):
+        """Авторы комментариев приходят вместе с комментариями."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:post_detail', args=(self.post.id,)))
+        comment_queries = [
+            query['sql'] for query in queries
+            if 'posts_comment' in query['sql']
+        ]
+        self.assertEqual(len(comment_queries), 1)
+        self.assertIn('JOIN "auth_user"', comment_queries[0])
+
+    def test_unknown_post_comments(self):
+        response = self.client.get(
+            reverse('posts:post_comments', args=(10 ** 6,))
+        )
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,25 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Проверка бюджета SQL-запросов на страницу для TestCase.
+
+    Бюджет задаётся числом, не зависящим от количества записей
+    на странице, поэтому любая N+1 регрессия выходит за его пределы.
+    """
+
+    def assertQueryBudget(self, url, budget, client=None, data=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, data)
+        executed = len(queries.captured_queries)
+        if executed > budget:
+            listing = '\n'.join(
+                f'{number}. {query["sql"]}' for number, query in
+                enumerate(queries.captured_queries, start=1)
+            )
+            self.fail(
+                f'{url}: {executed} запросов при бюджете {budget}\n{listing}'
+            )
+        return response
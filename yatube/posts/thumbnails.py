@@ -0,0 +1,203 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .caching import (
+    acquire, bump_generations, bump_post_versions, feed_scopes, post_scope,
+    release,
+)
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, в которых шаблоны показывают картинку поста.
+GEOMETRIES = {
+    'card': ('960x339', {'padding': True, 'upscale': True}),
+    'detail': ('960x339', {'upscale': True}),
+}
+# Ширины для srcset. Каждая рисуется в WebP и в JPEG для браузеров
+# без WebP; Pillow может быть собран без libwebp.
+WIDTHS = (480, 960, 1440)
+FORMATS = ('WEBP', 'JPEG') if features.check('webp') else ('JPEG',)
+FALLBACK_FORMAT = 'JPEG'
+SIZES = '(min-width: 960px) 960px, 100vw'
+# Блокировка задачи держится, пока та ждёт в очереди и рисует все
+# варианты; снимается по завершении, а TTL нужен, только если процесс
+# умер посреди задачи.
+JOB_LOCK_TIMEOUT = 10 * 60
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POST_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def thumbnail_options(source, options):
+    """Параметры миниатюры в том виде, в каком их дополняет sorl."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def variants(name):
+    """Варианты размера name: ((ширина, формат), геометрия, параметры)."""
+    geometry, options = GEOMETRIES[name]
+    width, height = (int(side) for side in geometry.split('x'))
+    for variant_width in WIDTHS:
+        variant_height = round(height * variant_width / width)
+        for image_format in FORMATS:
+            yield (
+                (variant_width, image_format),
+                f'{variant_width}x{variant_height}',
+                dict(options, format=image_format),
+            )
+
+
+def thumbnail_file(source, geometry, options):
+    """Миниатюра исходника в том виде, как её назовёт sorl (без файла)."""
+    filename = default.backend._get_thumbnail_filename(
+        source, geometry, thumbnail_options(source, options)
+    )
+    return ImageFile(filename, default.storage)
+
+
+def prefetch_variants(posts, name):
+    """Загружает варианты размера name для страницы постов одним
+    чтением кэша; cached_variants потом берёт их из поста."""
+    wanted = []
+    for post in posts:
+        post.__dict__.setdefault('_thumbnails', {})[name] = None
+        if post.image:
+            source = ImageFile(post.image)
+            wanted.append((post, {
+                variant: thumbnail_file(source, geometry, options)
+                for variant, geometry, options in variants(name)
+            }))
+    if not wanted:
+        return
+    found = default.kvstore.get_many(
+        thumbnail for _, files in wanted for thumbnail in files.values()
+    )
+    for post, files in wanted:
+        thumbnails = {
+            variant: found.get(thumbnail.key)
+            for variant, thumbnail in files.items()
+        }
+        if all(thumbnails.values()):
+            post._thumbnails[name] = thumbnails
+
+
+def cached_variants(post, name):
+    """Все варианты размера name по (ширина, формат) или None,
+    если хотя бы один ещё не нарисован."""
+    prefetched = post.__dict__.get('_thumbnails', {})
+    if name in prefetched:
+        return prefetched[name]
+    prefetch_variants([post], name)
+    return post.__dict__.pop('_thumbnails')[name]
+
+
+def job_key(post_id):
+    return f'thumbnails:{post_id}'
+
+
+def pregenerate(image):
+    """Рисует все миниатюры картинки; False, если рисовать нечего."""
+    if not image.exists():
+        return False
+    source = ImageFile(image)
+    files = [
+        thumbnail_file(source, geometry, options)
+        for name in GEOMETRIES
+        for variant, geometry, options in variants(name)
+    ]
+    if all(default.kvstore.get_many(files).values()):
+        return False
+    for name in GEOMETRIES:
+        for variant, geometry, options in variants(name):
+            get_thumbnail(image, geometry, **options)
+    return True
+
+
+def run(post_id, image, scopes):
+    """Задача поста; True, если миниатюры пришлось рисовать.
+
+    Посты и подписчиков задача из базы не читает: всё нужное
+    собирается при постановке, в потоке запроса.
+    """
+    try:
+        if pregenerate(image):
+            bump_post_versions([post_id])
+            bump_generations(scopes)
+            return True
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры поста %s', post_id)
+    finally:
+        release(job_key(post_id))
+    return False
+
+
+def run_in_worker(post_id, image, scopes):
+    try:
+        return run(post_id, image, scopes)
+    finally:
+        connections.close_all()
+
+
+def job_scopes(post):
+    """Области страниц, где видна картинка поста."""
+    group_slugs = [post.group.slug] if post.group_id else []
+    return feed_scopes(post.author, group_slugs) + [post_scope(post.pk)]
+
+
+def submit(post):
+    # Одна задача на пост, сколько бы страниц ни показали заглушку.
+    if not post.image or not acquire(job_key(post.pk), JOB_LOCK_TIMEOUT):
+        return
+    scopes = job_scopes(post)
+    if settings.POST_THUMBNAIL_WORKERS:
+        get_executor().submit(
+            run_in_worker, post.pk, ImageFile(post.image), scopes
+        )
+    else:
+        run(post.pk, ImageFile(post.image), scopes)
+
+
+def submit_missing(posts, name):
+    """Ставит задачи для постов, у которых ещё нет вариантов name:
+    загруженных раньше, импортированных, после сбоя задачи.
+
+    Найденные варианты остаются в постах, и шаблон не читает их
+    второй раз.
+    """
+    posts = list(posts)
+    prefetch_variants(posts, name)
+    for post in posts:
+        if post._thumbnails[name] is None:
+            submit(post)
+
+
+def schedule(post):
+    """Ставит подготовку миниатюр в очередь после фиксации транзакции."""
+    transaction.on_commit(lambda: submit(post))
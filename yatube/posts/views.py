@@ -2,20 +2,57 @@ from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404, redirect, render
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.http import Http404
 
 
-from .models import Group, Post, Follow
-from .forms import PostForm, CommentForm
+from .caching import (
+    INDEX_SCOPE, cache_page_by_generation, condition_by_generation,
+    follow_scope, get_group, group_scope, post_scope, profile_scope,
+    require_scope,
+)
+from .models import Comment, Post, Follow, Timeline, UserStats
+from .forms import PostForm, CommentForm, SearchForm
+from .paginators import CursorPaginator
+from .search import search_posts
+from .thumbnails import submit_missing as submit_missing_thumbnails
 
 
 User = get_user_model()
 
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
 
-def get_page_context(queryset, request):
-    paginator = Paginator(queryset, 10)
+
+def get_page_context(queryset, request, keys=('pub_date', 'id'),
+                     transform=None):
+    """Постраничный вывод ленты.
+
+    По умолчанию лента листается курсором (?after=/?before=) без подсчёта
+    всех записей; старые ссылки вида ?page=N обслуживает Paginator.
+    transform превращает строку queryset в объект для шаблона.
+    """
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if page_number is None:
+        paginator = CursorPaginator(
+            queryset, POSTS_PER_PAGE, keys=keys, transform=transform
+        )
+        page_obj = paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    else:
+        meta = queryset.model._meta
+        paginator = Paginator(
+            queryset.order_by(
+                *(f'-{meta.get_field(key).attname}' for key in keys)
+            ),
+            POSTS_PER_PAGE,
+        )
+        page_obj = paginator.get_page(page_number)
+        if transform is not None:
+            page_obj.object_list = [
+                transform(row) for row in page_obj.object_list
+            ]
     return {
         'paginator': paginator,
         'page_number': page_number,
@@ -23,69 +60,181 @@ def get_page_context(queryset, request):
     }
 
 
-@cache_page(20, key_prefix='index_page')
+def index_scopes(request):
+    return [INDEX_SCOPE]
+
+
+def group_scopes(request, slug):
+    return [require_scope(group_scope(slug), lambda: get_group(slug))]
+
+
+def get_author(request, username):
+    """Автор профиля со счётчиками; ищется один раз за запрос, так как
+    нужен и областям кэша, и самой странице."""
+    memo = request.__dict__.setdefault('_authors', {})
+    if username not in memo:
+        memo[username] = get_object_or_404(
+            User.objects.select_related('stats'), username=username
+        )
+    return memo[username]
+
+
+def profile_scopes(request, username):
+    return [require_scope(
+        profile_scope(username), lambda: get_author(request, username)
+    )]
+
+
+def post_scopes(request, post_id):
+    # Страница поста показывает и число постов автора, и группу.
+    found = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'group__slug'
+    ).first()
+    if found is None:
+        # Поколение несуществующего поста не заводится.
+        raise Http404('Такого поста нет.')
+    username, slug = found
+    scopes = [post_scope(post_id), profile_scope(username)]
+    if slug:
+        scopes.append(group_scope(slug))
+    return scopes
+
+
+def comments_scopes(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404('Такого поста нет.')
+    return [post_scope(post_id)]
+
+
+def get_comments_page(post_id, after=None):
+    """Страница активных комментариев поста, новые первыми.
+
+    Автор приходит в том же запросе; листается курсором по (created, id).
+    """
+    comments = Comment.objects.filter(
+        post_id=post_id, active=True
+    ).select_related('author').only(
+        'id', 'text', 'created',
+        'author__username', 'author__first_name', 'author__last_name',
+    )
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, keys=('created', 'id')
+    )
+    return paginator.get_page(after=after)
+
+
+def follow_scopes(request):
+    return [follow_scope(request.user.pk)]
+
+
+@condition_by_generation(index_scopes)
+@cache_page_by_generation(index_scopes)
 def index(request):
     template = 'posts/index.html'
     title = 'Последние обновления на сайте'
-    posts = Post.objects.all().select_related('author').all
+    posts = Post.objects.select_related('author', 'group')
     context = {
         'title': title,
-        'posts': posts,
     }
-    context.update(get_page_context(Post.objects.all(), request,))
+    context.update(get_page_context(posts, request))
     return render(request, template, context)
 
 
+@condition_by_generation(group_scopes)
+@cache_page_by_generation(group_scopes)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     title = 'Запись сообщества'
-    group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.all().select_related('slug').all
+    group = get_group(slug)
+    posts = group.posts.select_related('author', 'group')
     context = {
         'group': group,
-        'posts': posts,
         'title': title,
     }
-    context.update(get_page_context(group.posts.all(), request))
+    context.update(get_page_context(posts, request))
     return render(request, template, context)
 
 
+@condition_by_generation(profile_scopes)
+@cache_page_by_generation(profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=author)
+    author = get_author(request, username)
     template = 'posts/profile.html'
-    followers = Follow.objects.filter(author__username=username).count()
+    stats = UserStats.for_user(author)
     following = request.user.is_authenticated
     if following:
         following = author.following.filter(user=request.user).exists()
     context = {
         'author': author,
-        'posts': posts,
-        'followers': followers,
+        'stats': stats,
+        'followers': stats.followers_count,
         'following': following
     }
-    context.update(get_page_context(author.posts.all(), request))
+    posts = author.posts.select_related('author', 'group')
+    context.update(get_page_context(posts, request))
     return render(request, template, context)
 
 
+@condition_by_generation(post_scopes, csrf=True)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    posts_count = Post.objects.filter(author=post.author).count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
+    posts_count = UserStats.for_user(post.author).posts_count
+    # Посты, сохранённые без сигналов (импорт, старые записи), получают
+    # миниатюры при первом показе, как и карточки в лентах.
+    submit_missing_thumbnails([post], 'detail')
     template = 'posts/post_detail.html'
     form = CommentForm()
-    comments = post.comments.all()
     context = {
         'post': post,
         'posts_count': posts_count,
         'form': form,
-        'comments': comments,
+        'comments': get_comments_page(post.pk, request.GET.get('after')),
     }
     return render(request, template, context)
 
 
+@condition_by_generation(comments_scopes)
+@cache_page_by_generation(comments_scopes)
+def post_comments(request, post_id):
+    """Следующая страница комментариев фрагментом — для «Показать ещё»."""
+    context = {
+        'post_id': post_id,
+        'comments': get_comments_page(post_id, request.GET.get('after')),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
+def search(request):
+    form = SearchForm(request.GET or None)
+    posts = []
+    next_query = None
+    if form.is_valid():
+        group = form.cleaned_data['group']
+        author = form.cleaned_data['author']
+        posts, next_cursor = search_posts(
+            form.cleaned_data['q'],
+            POSTS_PER_PAGE,
+            group_id=group.pk if group else None,
+            author_id=author.pk if author else None,
+            after=request.GET.get('after'),
+        )
+        if next_cursor:
+            params = request.GET.copy()
+            params['after'] = next_cursor
+            next_query = params.urlencode()
+    context = {
+        'form': form,
+        'posts': posts,
+        'next_query': next_query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         create_post = form.save(commit=False)
         create_post.author = request.user
@@ -131,17 +280,21 @@ def add_comment(request, post_id):
 
 
 @login_required
+@condition_by_generation(follow_scopes)
+@cache_page_by_generation(follow_scopes)
 def follow_index(request):
     template = 'posts/follow.html'
     title = 'Подписки пользователя'
-    posts = Post.objects.filter(author__following__user=request.user).select_related("author", "group")
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    entries = Timeline.objects.filter(
+        user=request.user
+    ).select_related('post__author', 'post__group')
     context = {
         'title': title,
-        'page_obj': page_obj
     }
+    context.update(get_page_context(
+        entries, request, keys=('pub_date', 'post'),
+        transform=lambda entry: entry.post,
+    ))
     return render(request, template, context)
 
 
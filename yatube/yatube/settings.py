@@ -117,10 +117,42 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_SIZE': 32 * 1024 * 1024,
+            'LOCAL_TIMEOUT': 60,
+            'LOCAL_PREFIXES': (
+                'page:', 'card:', 'version:', 'generation:', 'group:',
+                'sorl-thumbnail||image||',
+            ),
+            'EPOCH_PREFIXES': ('version:', 'generation:'),
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    },
 }
 
+# Настройки тестов: см. core.testing.
+TEST_RUNNER = 'core.testing.TestRunner'
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Сессии читаются мимо памяти процесса: выход из аккаунта в одном
+# воркере должен сразу действовать во всех.
+SESSION_CACHE_ALIAS = 'shared'
+
+THUMBNAIL_CACHE = 'default'
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+# Потоки, в которых рисуются миниатюры загруженных картинок;
+# 0 — рисовать сразу, в том же потоке.
+POST_THUMBNAIL_WORKERS = 2
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]